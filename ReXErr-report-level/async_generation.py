@@ -0,0 +1,421 @@
+import asyncio
+import os
+import random
+import time
+from collections import namedtuple
+
+import aiohttp
+import openai
+openai.api_type = "azure"
+openai.api_version = "2023-05-15"
+
+from utils import (build_system_prompt, build_packed_system_prompt, build_packed_user_prompt, split_packed_output,
+                   parse_error_output, load_error_prompts, ENGINE, MAX_TOKENS, PACKED_PROMPT_VERSION)
+from generation_cache import cache_key
+
+# Outcome of one generation job; output is None and error describes the failure when it failed,
+# attempts is 0 when the output came from the cache. error_report and labels hold the parsed
+# output (see utils.parse_error_output); an output that could not be parsed is kept, with a
+# "ParseError: ..." error and without error_report/labels.
+GenerationResult = namedtuple('GenerationResult', ['index', 'output', 'error', 'attempts', 'error_report', 'labels'],
+                              defaults=(None, None))
+
+# Error of a completion that was cut off at max_tokens; its output is incomplete, so it is not used
+TRUNCATED_ERROR = "Truncated: the completion reached max_tokens"
+
+# Completion token budget of a packed request (the output limit of the deployment)
+PACKED_MAX_TOKENS = 4096
+
+# Completion token budget of each report in a packed request; a rewritten report and its label
+# dictionary rarely need more than this, while single-report requests keep the MAX_TOKENS budget
+PACKED_REPORT_MAX_TOKENS = 1000
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.TryAgain,
+)
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket: capacity tokens at most, refilled continuously at rate tokens per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, limit, burst_seconds=10):
+        """
+        Bucket for a per-minute limit that allows bursts of burst_seconds worth of tokens.
+        """
+        return cls(limit / 60.0, limit / 60.0 * burst_seconds)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount=1):
+        """
+        Wait until amount tokens are available and take them (waiters are served in order).
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def refund(self, amount):
+        """
+        Return unused tokens, e.g. when a completion used fewer tokens than reserved.
+        """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def is_retryable(error):
+    """
+    Whether a failed request should be retried (rate limits, server errors and connection problems).
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, 'http_status', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after(error):
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _describe(error):
+    status = getattr(error, 'http_status', None)
+    # prefer the API's own error message over the full repr with headers and body
+    message = (getattr(error, 'error', None) or {}).get('message') or str(error)
+    return f"{type(error).__name__} ({status}): {message}" if status else f"{type(error).__name__}: {message}"
+
+
+def _estimate_tokens(messages, max_tokens):
+    # ~4 characters per token for English text, plus the full completion budget
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
+
+
+class _Requester:
+    """
+    Sends chat-completion requests paced by the request/token buckets, retrying retryable errors.
+    """
+
+    def __init__(self, request_bucket, token_bucket, engine, max_retries, base_delay, max_delay):
+        self.request_bucket = request_bucket
+        self.token_bucket = token_bucket
+        self.engine = engine
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def complete(self, messages, max_tokens):
+        """
+        Returns:
+            Tuple (output, error, attempts); output is None and error describes the failure when it failed,
+            including a completion cut off at max_tokens (TRUNCATED_ERROR), which is not retried
+        """
+        reserved_tokens = _estimate_tokens(messages, max_tokens)
+        for attempt in range(1, self.max_retries + 2):
+            await self.request_bucket.acquire()
+            await self.token_bucket.acquire(reserved_tokens)
+            try:
+                response = await openai.ChatCompletion.acreate(engine=self.engine, messages=messages,
+                                                               max_tokens=max_tokens)
+            except openai.error.OpenAIError as error:
+                if not is_retryable(error) or attempt > self.max_retries:
+                    return None, _describe(error), attempt
+                # full jitter exponential backoff, but never earlier than the server asked for
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                await asyncio.sleep(max(delay, _retry_after(error) or 0))
+                continue
+
+            usage = response.get('usage') or {}
+            if 'total_tokens' in usage:
+                self.token_bucket.refund(max(0, reserved_tokens - usage['total_tokens']))
+            choice = response.choices[0]
+            if choice.get('finish_reason') == 'length':
+                return None, TRUNCATED_ERROR, attempt
+            return choice.message.content, None, attempt
+
+
+def _parsed_result(index, output, attempts):
+    try:
+        error_report, labels = parse_error_output(output)
+    except ValueError as parse_error:
+        return GenerationResult(index, output, f"ParseError: {parse_error}", attempts)
+    return GenerationResult(index, output, None, attempts, error_report, labels)
+
+
+def _cached_result(index, cache, key):
+    # Result of a cache hit, or None on a miss; only outputs that parse are cached, but entries
+    # written before outputs were validated may not, and are generated again
+    output = cache.get(key)
+    if output is None:
+        return None
+    result = _parsed_result(index, output, 0)
+    return result if result.error is None else None
+
+
+async def _generate_one(index, report, errors, requester, max_tokens, cache):
+    if cache is not None:
+        key = cache_key(report, errors, requester.engine)
+        result = _cached_result(index, cache, key)
+        if result is not None:
+            return result
+
+    messages = [
+        {"role": "system", "content": build_system_prompt(errors)},
+        {"role": "user", "content": f"{report}"},
+    ]
+    output, error, attempts = await requester.complete(messages, max_tokens)
+    if error is not None:
+        return GenerationResult(index, None, error, attempts)
+    result = _parsed_result(index, output, attempts)
+    if cache is not None and result.error is None:
+        cache.put(key, output)
+    return result
+
+
+async def generate_error_reports(jobs, concurrency=16, requests_per_minute=600, tokens_per_minute=300000,
+                                 engine=ENGINE, max_tokens=MAX_TOKENS, max_retries=6, base_delay=1.0,
+                                 max_delay=60.0, on_result=None, cache=None):
+    """
+    Generate error reports for many (report, errors) jobs with bounded concurrency.
+
+    Requests and tokens are paced with token buckets instead of fixed sleeps. Rate limit (429),
+    server (5xx) and connection errors are retried with jittered exponential backoff; other
+    errors, and jobs that run out of retries, are reported as failed results instead of being
+    dropped.
+
+    Args:
+        jobs: iterable of (report, errors) tuples, where errors is a list of three error prompt texts
+        concurrency: int, maximum number of requests in flight
+        requests_per_minute: float, request rate limit of the deployment
+        tokens_per_minute: float, token rate limit of the deployment
+        engine: str, Azure OpenAI deployment name
+        max_tokens: int, completion token budget per request
+        max_retries: int, retries per job for retryable errors
+        base_delay: float, initial backoff in seconds
+        max_delay: float, maximum backoff in seconds
+        on_result: optional callable invoked with each GenerationResult as soon as it is ready; an exception
+            it raises does not stop the other jobs
+        cache: optional GenerationCache; hits skip the API call entirely, and only outputs that parse
+            are stored
+
+    Returns:
+        List of GenerationResult in job order; outputs that do not parse are failed results with a
+        "ParseError: ..." error
+    """
+    requester = _Requester(TokenBucket.per_minute(requests_per_minute), TokenBucket.per_minute(tokens_per_minute),
+                           engine, max_retries, base_delay, max_delay)
+    job_iterator = enumerate(jobs)
+    results = {}
+
+    async def worker():
+        for index, (report, errors) in job_iterator:
+            try:
+                result = await _generate_one(index, report, errors, requester, max_tokens, cache)
+                results[index] = result
+                if on_result is not None:
+                    on_result(result)
+            except Exception as error:
+                # report unexpected failures (e.g. aiohttp errors) per job instead of cancelling every worker
+                if index not in results:
+                    results[index] = GenerationResult(index, None, _describe(error), 0)
+
+    # share one connection pool across all requests instead of a session per request
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        session_token = openai.aiosession.set(session)
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            openai.aiosession.reset(session_token)
+
+    return [results[index] for index in range(len(results))]
+
+
+def run_error_generation(jobs, **kwargs):
+    """
+    Synchronous entry point for generate_error_reports; see its arguments.
+    """
+    return asyncio.run(generate_error_reports(jobs, **kwargs))
+
+
+async def generate_packed_error_reports(jobs, pack_size=4, concurrency=16, requests_per_minute=600,
+                                        tokens_per_minute=300000, engine=ENGINE, max_tokens=MAX_TOKENS,
+                                        packed_max_tokens=PACKED_MAX_TOKENS,
+                                        report_max_tokens=PACKED_REPORT_MAX_TOKENS, max_retries=6, base_delay=1.0,
+                                        max_delay=60.0, on_result=None, cache=None):
+    """
+    Generate error reports, sending up to pack_size reports that share the same errors in one request.
+
+    Packing amortizes the system prompt over several reports. The completion is split back per
+    report and each part is validated with utils.parse_error_output; only the reports that fail
+    to parse are re-queued, once, as single-report requests (all reports of a pack whose
+    completion was cut off at its token budget are). Reports that still fail carry the parse
+    error in their result.
+
+    Outputs of packed requests are cached under their own key (see generation_cache.cache_key), so
+    single-report runs never reuse them; packed runs also use cached single-report outputs.
+
+    A packed request gets a completion budget of report_max_tokens per report. Packs are limited
+    to packed_max_tokens // report_max_tokens reports (4 with the defaults), so that the later
+    reports of a pack are not cut off by the output limit and re-queued as single requests.
+
+    Args:
+        jobs: iterable of (report, errors) tuples, where errors is a list of three error prompt texts
+        pack_size: int, maximum number of reports per request (lowered to fit packed_max_tokens)
+        packed_max_tokens: int, completion token limit of a request (the output limit of the deployment)
+        report_max_tokens: int, completion token budget of each report in a packed request
+        see generate_error_reports for the other arguments
+
+    Returns:
+        List of GenerationResult in job order, with error_report and labels filled for successes
+    """
+    requester = _Requester(TokenBucket.per_minute(requests_per_minute), TokenBucket.per_minute(tokens_per_minute),
+                           engine, max_retries, base_delay, max_delay)
+    pack_size = max(1, min(pack_size, packed_max_tokens // report_max_tokens))
+    results = {}
+    queue = asyncio.Queue()
+
+    def finish(result):
+        results[result.index] = result
+        if on_result is not None:
+            on_result(result)
+
+    def packed_key(report, errors):
+        return cache_key(report, errors, engine, packed_prompt_version=PACKED_PROMPT_VERSION)
+
+    # group reports by error triplet; cache hits (of packed or single-report requests) never reach the queue
+    groups = {}
+    num_jobs = 0
+    for index, (report, errors) in enumerate(jobs):
+        num_jobs += 1
+        if cache is not None:
+            result = (_cached_result(index, cache, packed_key(report, errors))
+                      or _cached_result(index, cache, cache_key(report, errors, engine)))
+            if result is not None:
+                finish(result)
+                continue
+        pack = groups.setdefault(tuple(errors), [])
+        pack.append((index, report))
+        if len(pack) == pack_size:
+            queue.put_nowait((list(errors), pack, False))
+            groups[tuple(errors)] = []
+    for errors, pack in groups.items():
+        if pack:
+            queue.put_nowait((list(errors), pack, False))
+
+    async def send(errors, pack, is_retry):
+        if len(pack) == 1:
+            messages = [
+                {"role": "system", "content": build_system_prompt(errors)},
+                {"role": "user", "content": f"{pack[0][1]}"},
+            ]
+            output, error, attempts = await requester.complete(messages, max_tokens)
+            sections = [output]
+        else:
+            messages = [
+                {"role": "system", "content": build_packed_system_prompt(errors, len(pack))},
+                {"role": "user", "content": build_packed_user_prompt([report for _, report in pack])},
+            ]
+            output, error, attempts = await requester.complete(messages, report_max_tokens * len(pack))
+            sections = split_packed_output(output, len(pack))
+
+        if error == TRUNCATED_ERROR and len(pack) > 1:
+            # the reports of a pack that ran out of tokens get their own request and budget
+            for index, report in pack:
+                queue.put_nowait((errors, [(index, report)], True))
+            return
+        if error is not None:
+            for index, _ in pack:
+                finish(GenerationResult(index, None, error, attempts))
+            return
+
+        for (index, report), section in zip(pack, sections):
+            try:
+                error_report, labels = parse_error_output(section)
+            except ValueError as parse_error:
+                if is_retry:
+                    finish(GenerationResult(index, section, f"ParseError: {parse_error}", attempts))
+                else:
+                    queue.put_nowait((errors, [(index, report)], True))
+                continue
+            if cache is not None:
+                key = packed_key(report, errors) if len(pack) > 1 else cache_key(report, errors, engine)
+                cache.put(key, section)
+            finish(GenerationResult(index, section, None, attempts, error_report, labels))
+
+    async def worker():
+        while True:
+            errors, pack, is_retry = await queue.get()
+            try:
+                await send(errors, pack, is_retry)
+            except Exception as error:
+                # report unexpected failures per job rather than losing the whole pack
+                for index, _ in pack:
+                    if index not in results:
+                        finish(GenerationResult(index, None, _describe(error), 0))
+            finally:
+                queue.task_done()
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        session_token = openai.aiosession.set(session)
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            openai.aiosession.reset(session_token)
+
+    return [results[index] for index in range(num_jobs)]
+
+
+def run_packed_error_generation(jobs, **kwargs):
+    """
+    Synchronous entry point for generate_packed_error_reports; see its arguments.
+    """
+    return asyncio.run(generate_packed_error_reports(jobs, **kwargs))
+
+
+if __name__ == "__main__":
+
+    # load in the prompt dictionary
+    error_prompts = load_error_prompts('ReXErr-report-level-error_prompts.json')
+
+    # define example report from mimic
+    sample_report = "Impression: Compared to chest radiographs since ___, most recently ___.  Large right and moderate left pleural effusions and severe bibasilar atelectasis are unchanged.  Cardiac silhouette is obscured.  No pneumothorax.  Pulmonary edema is mild, obscured radiographically by overlying abnormalities."
+    sample_jobs = [
+        (sample_report, [error_prompts[3], error_prompts[7], error_prompts[0]]),
+        (sample_report, [error_prompts[4], error_prompts[9], error_prompts[11]]),
+    ]
+
+    # define openai parameters
+    openai.api_key = os.environ['AZURE_OPENAI_API_KEY']
+    openai.api_base = os.environ['AZURE_OPENAI_ENDPOINT']
+
+    for result in run_error_generation(sample_jobs, concurrency=2):
+        if result.error is not None:
+            print(f"job {result.index} failed after {result.attempts} attempts: {result.error}")
+        else:
+            print(result.output)
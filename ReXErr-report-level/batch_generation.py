@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+
+from utils import build_system_prompt, parse_error_output, load_error_prompts, ENGINE, MAX_TOKENS
+from generation_cache import cache_key
+
+# Limits of one batch input file (the Batch API accepts at most 50,000 requests and 200 MB per file)
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+
+# Endpoint of the batch requests; Azure OpenAI global batch deployments use "/chat/completions"
+BATCH_URL = '/chat/completions'
+
+
+def request_id(index, report, errors, engine=ENGINE):
+    """
+    Stable custom id of a batch request
+
+    The job index joins results back to the corpus; the content digest makes an id change whenever
+    the report, the error prompts, the system prompt version or the engine change.
+
+    Args:
+        index: int, position of the job in the corpus
+        report: str, original report
+        errors: list of three error prompt texts
+        engine: str, deployment/model used for generation
+
+    Returns:
+        str, custom id such as 'job-0000042-1f3a9c0d5e7b2a48'
+    """
+    return f"job-{index:07d}-{cache_key(report, errors, engine)[:16]}"
+
+
+def batch_request(custom_id, report, errors, engine=ENGINE, max_tokens=MAX_TOKENS, url=BATCH_URL):
+    """
+    One line of a chat-completions batch input file
+
+    Returns:
+        Dict with custom_id, method, url and the chat-completions request body
+    """
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': url,
+        'body': {
+            'model': engine,
+            'messages': [
+                {"role": "system", "content": build_system_prompt(errors)},
+                {"role": "user", "content": f"{report}"},
+            ],
+            'max_tokens': max_tokens,
+        },
+    }
+
+
+def write_batch_requests(jobs, directory, prefix='requests', engine=ENGINE, max_tokens=MAX_TOKENS, url=BATCH_URL,
+                         max_requests=MAX_BATCH_REQUESTS, max_bytes=MAX_BATCH_BYTES):
+    """
+    Write generation jobs as sharded JSONL batch input files.
+
+    Jobs are streamed, so the corpus is never held in memory. A new shard is started whenever the
+    current one would exceed max_requests requests or max_bytes bytes.
+
+    Args:
+        jobs: iterable of (report, errors) tuples, where errors is a list of three error prompt texts
+            (e.g. from error_sampling.iter_generation_jobs)
+        directory: str, output directory
+        prefix: str, shard file name prefix
+        engine: str, deployment/model used for generation
+        max_tokens: int, completion token budget per request
+        url: str, endpoint of the requests
+        max_requests: int, maximum requests per shard
+        max_bytes: int, maximum size of a shard in bytes
+
+    Returns:
+        List of the shard paths, in job order
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    file = None
+    shard_requests = shard_bytes = 0
+    try:
+        for index, (report, errors) in enumerate(jobs):
+            request = batch_request(request_id(index, report, errors, engine), report, errors, engine, max_tokens, url)
+            line = (json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8')
+            if file is None or shard_requests >= max_requests or shard_bytes + len(line) > max_bytes:
+                if file is not None:
+                    file.close()
+                paths.append(os.path.join(directory, f"{prefix}-{len(paths):05d}.jsonl"))
+                file = open(paths[-1], 'wb')
+                shard_requests = shard_bytes = 0
+            file.write(line)
+            shard_requests += 1
+            shard_bytes += len(line)
+    finally:
+        if file is not None:
+            file.close()
+    return paths
+
+
+def job_index(custom_id):
+    """
+    Job index encoded in a custom id from request_id
+
+    Returns:
+        int
+    """
+    return int(custom_id.split('-')[1])
+
+
+def _result_outcome(result):
+    # Returns (output, failure reason); exactly one of them is None
+    response = result.get('response') or {}
+    if result.get('error') or response.get('status_code') != 200:
+        error = result.get('error') or (response.get('body') or {}).get('error') or {}
+        return None, f"failed ({response.get('status_code')}): {error.get('message') or error.get('code') or error}"
+    try:
+        choice = response['body']['choices'][0]
+        output = choice['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return None, "malformed: no completion in the response"
+    if choice.get('finish_reason') == 'length':
+        return None, "malformed: completion cut off at max_tokens"
+    return output, None
+
+
+def index_batch_results(result_paths):
+    """
+    Index batch output and error files by custom id without loading the results.
+
+    When a custom id has several results (e.g. a request that was retried), a successful result
+    is preferred over a failed one, and later results over earlier ones.
+
+    Args:
+        result_paths: list of str, batch output/error JSONL files
+
+    Returns:
+        Dict mapping custom id to (file number, byte offset) of its result line
+    """
+    index = {}
+    succeeded = set()
+    for file_number, path in enumerate(result_paths):
+        with open(path, 'rb') as file:
+            offset = 0
+            for line in file:
+                if line.strip():
+                    result = json.loads(line)
+                    custom_id = result['custom_id']
+                    ok = _result_outcome(result)[1] is None
+                    if ok or custom_id not in succeeded:
+                        index[custom_id] = (file_number, offset)
+                    if ok:
+                        succeeded.add(custom_id)
+                offset += len(line)
+    return index
+
+
+def ingest_batch_results(request_paths, result_paths, output_path, retry_path):
+    """
+    Join batch results to their requests and write the parsed error reports and a retry file.
+
+    The request shards are streamed in job order, and each result is read back from its file by
+    offset, so neither the corpus nor the results are held in memory. Every output is validated
+    with utils.parse_error_output. Requests that failed, produced an output that does not parse,
+    or have no result at all are copied unchanged to the retry file, which can be submitted as a
+    new batch and ingested the same way.
+
+    Args:
+        request_paths: list of str, batch input files from write_batch_requests (or a retry file)
+        result_paths: list of str, batch output and error files returned for them
+        output_path: str, JSONL file of generated reports to write, one record per successful job with
+            custom_id, index, original_report, output, error_report and labels
+        retry_path: str, JSONL batch input file of the requests to retry
+
+    Returns:
+        Dict of counts: requests, succeeded, failed, malformed, missing
+    """
+    results = index_batch_results(result_paths)
+    result_files = [open(path, 'rb') for path in result_paths]
+    counts = {'requests': 0, 'succeeded': 0, 'failed': 0, 'malformed': 0, 'missing': 0}
+    try:
+        with open(output_path, 'w', encoding='utf-8') as output_file, \
+                open(retry_path, 'w', encoding='utf-8') as retry_file:
+            for request_path in request_paths:
+                with open(request_path, 'r', encoding='utf-8') as request_file:
+                    for line in request_file:
+                        if not line.strip():
+                            continue
+                        request = json.loads(line)
+                        custom_id = request['custom_id']
+                        counts['requests'] += 1
+
+                        location = results.get(custom_id)
+                        if location is None:
+                            counts['missing'] += 1
+                            retry_file.write(line)
+                            continue
+                        file_number, offset = location
+                        result_files[file_number].seek(offset)
+                        output, failure = _result_outcome(json.loads(result_files[file_number].readline()))
+                        if failure is None:
+                            try:
+                                error_report, labels = parse_error_output(output)
+                            except ValueError:
+                                failure = 'malformed'
+                        if failure is not None:
+                            counts['malformed' if failure.startswith('malformed') else 'failed'] += 1
+                            retry_file.write(line)
+                            continue
+
+                        counts['succeeded'] += 1
+                        record = {
+                            'custom_id': custom_id,
+                            'index': job_index(custom_id),
+                            'original_report': request['body']['messages'][-1]['content'],
+                            'output': output,
+                            'error_report': error_report,
+                            'labels': {str(key): list(value) for key, value in labels.items()},
+                        }
+                        output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        for file in result_files:
+            file.close()
+    return counts
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Prepare and ingest chat-completions batch files for error generation.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prepare = subparsers.add_parser('prepare', help='write sharded batch input files from a corpus and a manifest')
+    prepare.add_argument('corpus', help='report-level CSV file with the original reports')
+    prepare.add_argument('manifest', help='error triplet manifest written by error_sampling.py')
+    prepare.add_argument('directory', help='directory of the batch input files to write')
+    prepare.add_argument('--report-column', default='original_report', help='CSV column with the report text')
+    prepare.add_argument('--prompts', default='ReXErr-report-level-error_prompts.json', help='error prompt JSON')
+    prepare.add_argument('--engine', default=ENGINE, help='deployment/model name of the requests')
+    prepare.add_argument('--max-requests', type=int, default=MAX_BATCH_REQUESTS, help='requests per shard')
+
+    ingest = subparsers.add_parser('ingest', help='join batch results to their requests')
+    ingest.add_argument('--requests', nargs='+', required=True, help='batch input files')
+    ingest.add_argument('--results', nargs='+', required=True, help='batch output and error files')
+    ingest.add_argument('--output', required=True, help='JSONL file of generated error reports to write')
+    ingest.add_argument('--retry', required=True, help='batch input file of the requests to retry')
+    args = parser.parse_args()
+
+    if args.command == 'prepare':
+        from error_sampling import iter_generation_jobs, read_reports
+        jobs = iter_generation_jobs(args.manifest, read_reports(args.corpus, args.report_column),
+                                    load_error_prompts(args.prompts))
+        paths = write_batch_requests(jobs, args.directory, engine=args.engine, max_requests=args.max_requests)
+        print(f"Wrote {len(paths)} batch input files to '{args.directory}'")
+    else:
+        counts = ingest_batch_results(args.requests, args.results, args.output, args.retry)
+        print(f"{counts['requests']} requests: {counts['succeeded']} succeeded, {counts['failed']} failed, "
+              f"{counts['malformed']} malformed, {counts['missing']} missing. Results saved to '{args.output}', "
+              f"requests to retry to '{args.retry}'")
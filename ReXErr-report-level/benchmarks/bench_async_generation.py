@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import openai
+from async_generation import run_error_generation, run_packed_error_generation
+from mock_chat_server import start_server
+
+SAMPLE_REPORTS = [
+    "Impression: Compared to chest radiographs since ___, most recently ___.  Large right and moderate left pleural effusions and severe bibasilar atelectasis are unchanged.  Cardiac silhouette is obscured.  No pneumothorax.  Pulmonary edema is mild, obscured radiographically by overlying abnormalities.",
+    "No acute cardiopulmonary process.",
+    "Right IJ central venous catheter ends in the mid SVC.  Heart size is normal.  There is no focal consolidation, pleural effusion or pneumothorax.",
+]
+SAMPLE_ERRORS = ["Change severity.", "Add repetitions.", "Add medical device."]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure async generation throughput against a local stand-in server.')
+    parser.add_argument('--jobs', type=int, default=400, help='number of reports to generate')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--latency', type=float, default=0.1, help='server latency per request in seconds')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.05, help='fraction of requests answered with 429')
+    parser.add_argument('--server-error-rate', type=float, default=0.02, help='fraction of requests answered with 500')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of report outputs left unparseable')
+    parser.add_argument('--pack-size', type=int, default=1, help='reports per request (packed mode when > 1)')
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, rate_limit_rate=args.rate_limit_rate,
+                          server_error_rate=args.server_error_rate, malformed_rate=args.malformed_rate)
+    openai.api_key = 'local'
+    openai.api_base = f"http://127.0.0.1:{server.server_port}"
+
+    jobs = [(SAMPLE_REPORTS[i % len(SAMPLE_REPORTS)], SAMPLE_ERRORS) for i in range(args.jobs)]
+    for concurrency in args.concurrency:
+        settings = dict(concurrency=concurrency, requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9,
+                        base_delay=0.05, max_delay=0.5)
+        start = time.perf_counter()
+        if args.pack_size > 1:
+            results = run_packed_error_generation(jobs, pack_size=args.pack_size, **settings)
+        else:
+            results = run_error_generation(jobs, **settings)
+        elapsed = time.perf_counter() - start
+        failed = sum(result.error is not None for result in results)
+        attempts = sum(result.attempts for result in results) / len(results)
+        print(f"concurrency {concurrency:4d}: {len(results) / elapsed:8.1f} reports/s, "
+              f"{failed} failed, {attempts:.2f} attempts/report")
+
+    server.shutdown()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import random
+
+from mock_chat_server import mock_completion
+
+
+def write_mock_results(request_paths, output_path, error_path, failure_rate=0.0, malformed_rate=0.0,
+                       missing_rate=0.0, seed=0):
+    """
+    Answer batch input files offline, writing batch output and error files in the Batch API format.
+
+    Results are written in shuffled order, like a real batch, with completions from
+    mock_chat_server.mock_completion.
+
+    Args:
+        request_paths: list of str, batch input files
+        output_path: str, batch output file to write (successful and malformed results)
+        error_path: str, batch error file to write (failed requests)
+        failure_rate: float, fraction of requests that fail with a 500 error
+        malformed_rate: float, fraction of completions returned without their label dictionary
+        missing_rate: float, fraction of requests with no result at all
+        seed: int, random seed
+
+    Returns:
+        Dict of counts: succeeded, failed, missing
+    """
+    random.seed(seed)
+    requests = []
+    for path in request_paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            requests.extend(json.loads(line) for line in file if line.strip())
+    random.shuffle(requests)
+
+    counts = {'succeeded': 0, 'failed': 0, 'missing': 0}
+    with open(output_path, 'w', encoding='utf-8') as output_file, \
+            open(error_path, 'w', encoding='utf-8') as error_file:
+        for number, request in enumerate(requests):
+            roll = random.random()
+            if roll < missing_rate:
+                counts['missing'] += 1
+                continue
+            result = {'id': f'batch_req_{number}', 'custom_id': request['custom_id']}
+            if roll < missing_rate + failure_rate:
+                counts['failed'] += 1
+                result['response'] = {'status_code': 500, 'request_id': f'req_{number}',
+                                      'body': {'error': {'message': 'Internal server error', 'type': 'server_error'}}}
+                result['error'] = None
+                error_file.write(json.dumps(result) + '\n')
+                continue
+            counts['succeeded'] += 1
+            result['response'] = {'status_code': 200, 'request_id': f'req_{number}',
+                                  'body': mock_completion(request['body'], malformed_rate)}
+            result['error'] = None
+            output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write local batch result fixtures for batch input files.')
+    parser.add_argument('requests', nargs='+', help='batch input files')
+    parser.add_argument('--output', required=True, help='batch output file to write')
+    parser.add_argument('--errors', required=True, help='batch error file to write')
+    parser.add_argument('--failure-rate', type=float, default=0.02, help='fraction of requests that fail')
+    parser.add_argument('--malformed-rate', type=float, default=0.02, help='fraction of outputs left unparseable')
+    parser.add_argument('--missing-rate', type=float, default=0.01, help='fraction of requests without a result')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    counts = write_mock_results(args.requests, args.output, args.errors, args.failure_rate, args.malformed_rate,
+                                args.missing_rate, args.seed)
+    print(f"{counts['succeeded']} succeeded, {counts['failed']} failed, {counts['missing']} missing")
@@ -0,0 +1,141 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Azure OpenAI chat-completions endpoint.
+
+    Echoes the user report back followed by a sentence-index dictionary in the format the
+    system prompt asks for (per report block for packed requests). Latency, 429/500 failures
+    and malformed report outputs are injected according to the server settings.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if not self.path.split('?')[0].endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found', 'type': 'invalid_request_error'}})
+            return
+
+        server = self.server
+        time.sleep(server.latency)
+        roll = random.random()
+        if roll < server.rate_limit_rate:
+            self._send_json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit_error'}},
+                            {'Retry-After': '0'})
+            return
+        if roll < server.rate_limit_rate + server.server_error_rate:
+            self._send_json(500, {'error': {'message': 'Internal server error', 'type': 'server_error'}})
+            return
+
+        with server.lock:
+            server.completed += 1
+
+        self._send_json(200, mock_completion(request, server.malformed_rate))
+
+
+_PACKED_BLOCK = re.compile(r'\[\[REPORT (\d+)\]\]\n(.*?)\n\[\[END REPORT \1\]\]', re.DOTALL)
+
+
+def _mock_output(report, malformed_rate):
+    if random.random() < malformed_rate:
+        return report
+    sentences = [sentence for sentence in re.split(r'(?<=[.!?])\s+', report) if sentence.strip()]
+    labels = {index: [0, '', index] for index in range(len(sentences))}
+    return f"{report}\n\n{labels}"
+
+
+def mock_completion(request, malformed_rate=0.0):
+    """
+    Build a chat-completions response that echoes the report(s) of a request.
+
+    Args:
+        request: dict, chat-completions request body
+        malformed_rate: float, fraction of report outputs returned without their label dictionary
+
+    Returns:
+        Dict, chat-completions response body
+    """
+    user_content = request['messages'][-1]['content']
+    blocks = _PACKED_BLOCK.findall(user_content)
+    if blocks:
+        content = "\n".join(
+            f"[[REPORT {k}]]\n{_mock_output(report, malformed_rate)}\n[[END REPORT {k}]]" for k, report in blocks
+        )
+    else:
+        content = _mock_output(user_content, malformed_rate)
+    prompt_tokens = sum(len(message['content']) for message in request['messages']) // 4
+    completion_tokens = len(content) // 4
+    return {
+        'id': 'chatcmpl-mock',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': 'mock',
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+def start_server(port=0, latency=0.2, rate_limit_rate=0.0, server_error_rate=0.0, malformed_rate=0.0):
+    """
+    Start the stand-in server on a background thread.
+
+    Args:
+        port: int, port to listen on (0 picks a free port)
+        latency: float, seconds to wait before answering each request
+        rate_limit_rate: float, fraction of requests answered with 429
+        server_error_rate: float, fraction of requests answered with 500
+        malformed_rate: float, fraction of report outputs returned without their label dictionary
+
+    Returns:
+        The running ThreadingHTTPServer; its base URL is f"http://127.0.0.1:{server.server_port}"
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockChatHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.rate_limit_rate = rate_limit_rate
+    server.server_error_rate = server_error_rate
+    server.malformed_rate = malformed_rate
+    server.completed = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the chat-completions endpoint.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per request')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of report outputs left unparseable')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.rate_limit_rate, args.server_error_rate, args.malformed_rate)
+    print(f"Serving chat completions on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
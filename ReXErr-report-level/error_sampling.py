@@ -0,0 +1,234 @@
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from utils import errors_word_dict, load_error_prompts
+
+# Every report is assigned this many error categories, one per <<<k>>> slot of the system prompt
+ERRORS_PER_REPORT = 3
+
+# Marker of the prompts the system prompt asks the model to prefer when not all three errors fit
+PRIORITY_TAG = '[priority error]'
+
+MANIFEST_VERSION = 1
+
+
+def priority_categories(error_prompts):
+    """
+    Error categories whose prompt is marked as a priority error
+
+    Args:
+        error_prompts: dict from utils.load_error_prompts
+
+    Returns:
+        Sorted list of category indices
+    """
+    return sorted(key for key, prompt in error_prompts.items() if key in errors_word_dict and PRIORITY_TAG in prompt)
+
+
+def _weight_matrix(weights, strata, num_reports):
+    # Returns the per-stratum weight rows and the stratum index of every report
+    num_categories = len(errors_word_dict)
+    if strata is None:
+        if isinstance(weights, dict):
+            raise ValueError("Per-stratum weights require strata")
+        matrix = np.ones((1, num_categories)) if weights is None else np.asarray(weights, dtype=float)[None, :]
+        return matrix, np.zeros(num_reports, dtype=np.intp)
+
+    strata = np.asarray(strata)
+    if len(strata) != num_reports:
+        raise ValueError(f"Got {len(strata)} strata for {num_reports} reports")
+    labels, stratum_index = np.unique(strata, return_inverse=True)
+    if weights is None or not isinstance(weights, dict):
+        row = np.ones(num_categories) if weights is None else np.asarray(weights, dtype=float)
+        return np.tile(row, (len(labels), 1)), stratum_index
+    missing = [label for label in labels.tolist() if label not in weights]
+    if missing:
+        raise ValueError(f"No weights for strata {missing}")
+    return np.array([weights[label] for label in labels.tolist()], dtype=float), stratum_index
+
+
+def sample_error_triplets(num_reports, priority, weights=None, strata=None, min_priority=0, seed=0):
+    """
+    Assign three distinct error categories to every report in one vectorized draw.
+
+    Categories are drawn without replacement with probability proportional to their weight, using
+    Gumbel top-k (the three largest of log(weight) + Gumbel noise). With min_priority, the
+    min_priority highest-keyed priority categories of each report are always kept. The order of the
+    three slots is shuffled afterwards, so forced priority errors are not always in slot 1.
+
+    Args:
+        num_reports: int, number of reports
+        priority: sequence of priority category indices, from priority_categories of the error prompts
+        weights: None (uniform), a sequence of len(errors_word_dict) category weights, or, with
+            strata, a dict mapping each stratum label to such a sequence
+        strata: optional sequence of num_reports stratum labels (e.g. split or report length bucket)
+        min_priority: int, minimum number of priority categories per report
+        seed: int, seed of the NumPy generator; the same arguments always give the same triplets
+
+    Returns:
+        Tuple (categories, is_priority): int8 array of shape (num_reports, 3) with indices into
+        errors_word_dict, and a bool array of the same shape flagging priority categories
+    """
+    num_categories = len(errors_word_dict)
+    matrix, stratum_index = _weight_matrix(weights, strata, num_reports)
+    if matrix.shape[1] != num_categories:
+        raise ValueError(f"Expected {num_categories} category weights, got {matrix.shape[1]}")
+    if (matrix < 0).any():
+        raise ValueError("Category weights must be non-negative")
+    priority = np.asarray(sorted(priority), dtype=np.intp)
+    if (np.count_nonzero(matrix, axis=1) < ERRORS_PER_REPORT).any():
+        raise ValueError(f"Every stratum needs at least {ERRORS_PER_REPORT} categories with a positive weight")
+    if min_priority and (np.count_nonzero(matrix[:, priority], axis=1) < min_priority).any():
+        raise ValueError(f"Every stratum needs at least {min_priority} priority categories with a positive weight")
+
+    rng = np.random.default_rng(seed)
+    with np.errstate(divide='ignore'):
+        log_weights = np.log(matrix)
+    keys = log_weights[stratum_index] + rng.gumbel(size=(num_reports, num_categories))
+    if min_priority:
+        rows = np.arange(num_reports)[:, None]
+        forced = priority[np.argsort(-keys[:, priority], axis=1, kind='stable')[:, :min_priority]]
+        keys[rows, forced] = np.inf
+
+    top = np.argpartition(-keys, ERRORS_PER_REPORT - 1, axis=1)[:, :ERRORS_PER_REPORT]
+    slots = np.argsort(rng.random((num_reports, ERRORS_PER_REPORT)), axis=1)
+    categories = np.take_along_axis(top, slots, axis=1).astype(np.int8)
+    return categories, np.isin(categories, priority)
+
+
+def write_manifest(path, categories, is_priority, header=None):
+    """
+    Write a generation job manifest.
+
+    The first line is a JSON header; every following line is a compact JSON array
+    [row, error_1, error_2, error_3, priority_mask] for one report, in corpus order, where bit k of
+    priority_mask flags slot k + 1 as a priority error.
+
+    Args:
+        path: str, manifest file (JSONL)
+        categories: int array of shape (num_reports, 3), from sample_error_triplets
+        is_priority: bool array of shape (num_reports, 3)
+        header: optional dict of extra header fields (seed, weights, ...)
+    """
+    masks = (is_priority.astype(np.int64) << np.arange(ERRORS_PER_REPORT)).sum(axis=1)
+    table = np.column_stack([np.arange(len(categories)), categories, masks])
+    manifest_header = {
+        'manifest': 'error_triplets', 'version': MANIFEST_VERSION, 'num_reports': len(categories),
+        'categories': {str(key): name for key, name in errors_word_dict.items()},
+    }
+    manifest_header.update(header or {})
+    with open(path, 'w') as file:
+        file.write(json.dumps(manifest_header) + '\n')
+        np.savetxt(file, table, fmt='[%d,%d,%d,%d,%d]')
+
+
+def read_manifest_header(path):
+    """
+    Read the JSON header of a manifest written by write_manifest
+
+    Returns:
+        Dict
+    """
+    with open(path, 'r') as file:
+        header = json.loads(file.readline())
+    if header.get('manifest') != 'error_triplets':
+        raise ValueError(f"'{path}' is not an error triplet manifest")
+    return header
+
+
+def iter_manifest(path):
+    """
+    Stream the rows of a manifest written by write_manifest
+
+    Returns:
+        Iterator of (row, [error categories], [priority flags]) tuples
+    """
+    with open(path, 'r') as file:
+        file.readline()
+        for line in file:
+            row, *categories, mask = json.loads(line)
+            yield row, categories, [bool(mask >> slot & 1) for slot in range(ERRORS_PER_REPORT)]
+
+
+def iter_generation_jobs(manifest_path, reports, error_prompts):
+    """
+    Join a manifest with the corpus it was sampled for, lazily, as (report, errors) generation jobs.
+
+    Args:
+        manifest_path: str, manifest written by write_manifest
+        reports: iterable of original report texts, in the order the manifest was sampled for
+        error_prompts: dict from utils.load_error_prompts
+
+    Returns:
+        Iterator of (report, list of three error prompt texts) tuples, accepted by
+        async_generation.run_error_generation and its packed variant
+    """
+    rows = iter_manifest(manifest_path)
+    for expected_row, report in enumerate(reports):
+        entry = next(rows, None)
+        if entry is None:
+            raise ValueError(f"Manifest '{manifest_path}' has fewer rows than the corpus")
+        row, categories, _ = entry
+        if row != expected_row:
+            raise ValueError(f"Manifest row {row} found where row {expected_row} was expected")
+        yield report, [error_prompts[category] for category in categories]
+    if next(rows, None) is not None:
+        raise ValueError(f"Manifest '{manifest_path}' has more rows than the corpus")
+
+
+def read_reports(path, report_column='original_report', strata_column=None):
+    """
+    Stream the reports (and optionally a stratum label) of a report-level CSV file
+
+    Returns:
+        Iterator of report texts, or of (report, stratum) tuples with strata_column
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(path, 'r', newline='') as file:
+        for record in csv.DictReader(file):
+            if strata_column is None:
+                yield record[report_column]
+            else:
+                yield record[report_column], record[strata_column]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Sample three error categories per report into a job manifest.')
+    parser.add_argument('corpus', help='report-level CSV file with the original reports')
+    parser.add_argument('manifest', help='manifest (JSONL) to write')
+    parser.add_argument('--seed', type=int, default=0, help='sampling seed')
+    parser.add_argument('--weights', default=None,
+                        help='JSON file with a list of 12 category weights, or a dict of them per stratum')
+    parser.add_argument('--strata-column', default=None, help='CSV column with the stratum label of each report')
+    parser.add_argument('--min-priority', type=int, default=0, help='minimum priority errors per report')
+    parser.add_argument('--report-column', default='original_report', help='CSV column with the report text')
+    parser.add_argument('--prompts', default='ReXErr-report-level-error_prompts.json', help='error prompt JSON')
+    args = parser.parse_args()
+
+    weights = None
+    if args.weights:
+        with open(args.weights, 'r') as file:
+            weights = json.load(file)
+    strata = None
+    if args.strata_column:
+        strata = [stratum for _, stratum in read_reports(args.corpus, args.report_column, args.strata_column)]
+        num_reports = len(strata)
+    else:
+        num_reports = sum(1 for _ in read_reports(args.corpus, args.report_column))
+
+    priority = priority_categories(load_error_prompts(args.prompts))
+    categories, is_priority = sample_error_triplets(num_reports, priority, weights, strata, args.min_priority,
+                                                    args.seed)
+    write_manifest(args.manifest, categories, is_priority, {
+        'corpus': args.corpus, 'seed': args.seed, 'weights': weights, 'strata_column': args.strata_column,
+        'min_priority': args.min_priority, 'priority': priority,
+    })
+    counts = np.bincount(categories.ravel(), minlength=len(errors_word_dict))
+    for category, count in enumerate(counts):
+        print(f"{errors_word_dict[category]:<28}{count:>10}")
+    print(f"Sampled errors for {num_reports} reports. Manifest saved to '{args.manifest}'")
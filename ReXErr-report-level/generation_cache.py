@@ -0,0 +1,193 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from utils import ENGINE, SYSTEM_PROMPT_VERSION
+
+
+def cache_key(report, errors, engine=ENGINE, system_prompt_version=SYSTEM_PROMPT_VERSION,
+              packed_prompt_version=None):
+    """
+    Content address of a generation request
+
+    Args:
+        report: str, original report
+        errors: list of three error prompt texts
+        engine: str, deployment/model used for generation
+        system_prompt_version: int, version of build_system_prompt
+        packed_prompt_version: int, version of the packed prompts for outputs of a packed request
+            (utils.PACKED_PROMPT_VERSION), None for single-report requests
+
+    Returns:
+        str, hex SHA-256 digest
+    """
+    fields = [report, list(errors), system_prompt_version, engine]
+    if packed_prompt_version is not None:
+        # outputs of the packed prompt never share a key with single-report outputs
+        fields.append(['packed', packed_prompt_version])
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """
+    Persistent SQLite cache of generated error reports, keyed by cache_key.
+
+    Entries are evicted least recently used first once the cache exceeds max_bytes of stored
+    output or max_entries entries, down to low_water times the caps so that eviction runs once
+    per many puts rather than on every put. Access times of hits are buffered and written in
+    batches. Hit and miss counts cover the lifetime of this object.
+    """
+
+    def __init__(self, path, max_bytes=None, max_entries=None, low_water=0.9, access_flush_size=1000):
+        """
+        Args:
+            path: str, SQLite database file
+            max_bytes: int, cap on the total size of stored outputs (None for no cap)
+            max_entries: int, cap on the number of entries (None for no cap)
+            low_water: float, fraction of the caps the cache is trimmed to when it goes over them
+            access_flush_size: int, number of hits whose access times are buffered before being written
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.low_water = low_water
+        self.access_flush_size = access_flush_size
+        self.hits = 0
+        self.misses = 0
+        self._accessed = {}
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS generations ('
+            'key TEXT PRIMARY KEY, output TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS generations_last_access ON generations (last_access)')
+        self._connection.commit()
+        self._count_entries()
+
+    def _count_entries(self):
+        # running totals, so put only has to evict when they go over a cap
+        self._entries, self._bytes = self._connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations'
+        ).fetchone()
+
+    def get(self, key):
+        """
+        Look up a cached output
+
+        Args:
+            key: str, cache key
+
+        Returns:
+            str output, or None on a miss
+        """
+        row = self._connection.execute('SELECT output FROM generations WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._accessed[key] = time.time()
+        if len(self._accessed) >= self.access_flush_size:
+            self.flush()
+        return row[0]
+
+    def flush(self):
+        """
+        Write the buffered access times of hits
+        """
+        if not self._accessed:
+            return
+        self._connection.executemany(
+            'UPDATE generations SET last_access = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self._accessed.items()]
+        )
+        self._connection.commit()
+        self._accessed = {}
+
+    def put(self, key, output):
+        """
+        Store an output, and evict old entries if the cache went over its caps
+
+        Args:
+            key: str, cache key
+            output: str, generated error report
+        """
+        now = time.time()
+        size = len(output.encode('utf-8'))
+        previous = self._connection.execute('SELECT size FROM generations WHERE key = ?', (key,)).fetchone()
+        self._connection.execute(
+            'INSERT OR REPLACE INTO generations (key, output, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+            (key, output, size, now, now)
+        )
+        self._connection.commit()
+        self._accessed.pop(key, None)
+        if previous is None:
+            self._entries += 1
+            self._bytes += size
+        else:
+            self._bytes += size - previous[0]
+        if ((self.max_entries is not None and self._entries > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache is within low_water times max_bytes and max_entries
+
+        Returns:
+            Number of evicted entries
+        """
+        self.flush()
+        # other processes may share the database, so start from its actual totals
+        self._count_entries()
+        evicted = 0
+        if self.max_entries is not None and self._entries > self.max_entries:
+            target = int(self.max_entries * self.low_water)
+            evicted += self._connection.execute(
+                'DELETE FROM generations WHERE key IN '
+                '(SELECT key FROM generations ORDER BY last_access, key LIMIT ?)',
+                (self._entries - target,)
+            ).rowcount
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            # keep the most recently used entries whose cumulative size fits in the low-water mark
+            evicted += self._connection.execute(
+                'DELETE FROM generations WHERE key IN (SELECT key FROM ('
+                'SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key DESC) AS total FROM generations'
+                ') WHERE total > ?)',
+                (int(self.max_bytes * self.low_water),)
+            ).rowcount
+        self._connection.commit()
+        if evicted:
+            self._count_entries()
+        return evicted
+
+    def stats(self):
+        """
+        Cache statistics
+
+        Returns:
+            Dict with hits, misses, hit_rate, entries and bytes
+        """
+        self.flush()
+        entries, size = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
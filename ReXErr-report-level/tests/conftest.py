@@ -0,0 +1,7 @@
+import os
+import sys
+
+REPORT_LEVEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPORT_LEVEL_DIR)
+# the local chat-completions stand-ins in benchmarks/ answer the requests of the generation tests
+sys.path.insert(0, os.path.join(REPORT_LEVEL_DIR, 'benchmarks'))
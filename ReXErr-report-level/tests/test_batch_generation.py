@@ -0,0 +1,94 @@
+import json
+
+import batch_generation
+from batch_generation import ingest_batch_results, job_index, request_id, write_batch_requests
+from mock_batch_results import write_mock_results
+from utils import parse_error_output
+
+ERRORS = ['error one', 'error two', 'error three']
+REPORTS = [
+    f"Report {number}: heart size is normal. {note} No pneumothorax."
+    for number, note in enumerate(['Pleural effusión is stable.', 'Größe unverändert.', '肺野清晰。',
+                                   'Small left effusion – unchanged.', 'Lungs are clear.'] * 8)
+]
+
+
+def _read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _outcomes(result_paths):
+    # custom id -> whether its mock result is a completion that parses
+    outcomes = {}
+    for path in result_paths:
+        for result in _read_jsonl(path):
+            output, failure = batch_generation._result_outcome(result)
+            if failure is None:
+                try:
+                    parse_error_output(output)
+                except ValueError:
+                    failure = 'malformed'
+            outcomes[result['custom_id']] = failure is None
+    return outcomes
+
+
+def test_prepare_ingest_round_trip(tmp_path):
+    jobs = [(report, ERRORS) for report in REPORTS]
+    request_paths = write_batch_requests(iter(jobs), str(tmp_path / 'requests'), max_requests=16)
+    assert len(request_paths) == 3
+    requests = [request for path in request_paths for request in _read_jsonl(path)]
+    assert [request['custom_id'] for request in requests] == [
+        request_id(index, report, errors) for index, (report, errors) in enumerate(jobs)
+    ]
+    assert [request['body']['messages'][-1]['content'] for request in requests] == REPORTS
+
+    result_paths = [str(tmp_path / 'output.jsonl'), str(tmp_path / 'errors.jsonl')]
+    mock_counts = write_mock_results(request_paths, *result_paths, failure_rate=0.15, malformed_rate=0.15,
+                                     missing_rate=0.1, seed=1)
+    outcomes = _outcomes(result_paths)
+    output_path, retry_path = str(tmp_path / 'generated.jsonl'), str(tmp_path / 'retry.jsonl')
+    counts = ingest_batch_results(request_paths, result_paths, output_path, retry_path)
+
+    succeeded = [request for request in requests if outcomes.get(request['custom_id'])]
+    assert counts['requests'] == len(REPORTS)
+    assert counts['succeeded'] == len(succeeded)
+    assert counts['failed'] == mock_counts['failed'] > 0
+    assert counts['missing'] == mock_counts['missing'] > 0
+    assert counts['malformed'] == mock_counts['succeeded'] - len(succeeded) > 0
+
+    records = _read_jsonl(output_path)
+    assert [record['custom_id'] for record in records] == [request['custom_id'] for request in succeeded]
+    for record in records:
+        assert record['index'] == job_index(record['custom_id'])
+        assert record['original_report'] == REPORTS[record['index']]
+        error_report, labels = parse_error_output(record['output'])
+        assert record['error_report'] == error_report
+        assert record['labels'] == {str(key): list(value) for key, value in labels.items()}
+
+    # the retry file holds exactly the other requests, unchanged and in job order
+    retries = _read_jsonl(retry_path)
+    assert retries == [request for request in requests if not outcomes.get(request['custom_id'])]
+
+    # a second round on the retry file completes the corpus
+    retry_results = [str(tmp_path / 'retry_output.jsonl'), str(tmp_path / 'retry_errors.jsonl')]
+    write_mock_results([retry_path], *retry_results, seed=2)
+    retry_counts = ingest_batch_results([retry_path], retry_results, str(tmp_path / 'generated_retry.jsonl'),
+                                        str(tmp_path / 'retry_retry.jsonl'))
+    assert retry_counts == {'requests': len(retries), 'succeeded': len(retries), 'failed': 0, 'malformed': 0,
+                            'missing': 0}
+    indexes = [record['index'] for record in records + _read_jsonl(str(tmp_path / 'generated_retry.jsonl'))]
+    assert sorted(indexes) == list(range(len(REPORTS)))
+
+
+def test_ingest_prefers_a_successful_result(tmp_path):
+    request_paths = write_batch_requests([(REPORTS[2], ERRORS)], str(tmp_path / 'requests'))
+    result_paths = [str(tmp_path / 'output.jsonl'), str(tmp_path / 'errors.jsonl')]
+    write_mock_results(request_paths, *result_paths)
+    # an earlier failed attempt of the same request, in a later file
+    failed_path = str(tmp_path / 'failed.jsonl')
+    write_mock_results(request_paths, str(tmp_path / 'unused.jsonl'), failed_path, failure_rate=1.0)
+    counts = ingest_batch_results(request_paths, result_paths + [failed_path], str(tmp_path / 'generated.jsonl'),
+                                  str(tmp_path / 'retry.jsonl'))
+    assert counts['succeeded'] == 1
+    assert _read_jsonl(str(tmp_path / 'generated.jsonl'))[0]['original_report'] == REPORTS[2]
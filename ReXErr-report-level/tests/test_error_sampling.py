@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from error_sampling import (ERRORS_PER_REPORT, iter_generation_jobs, iter_manifest, priority_categories,
+                            read_manifest_header, sample_error_triplets, write_manifest)
+from utils import errors_word_dict, load_error_prompts
+
+PROMPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'ReXErr-report-level-error_prompts.json')
+
+
+@pytest.fixture(scope='module')
+def error_prompts():
+    return load_error_prompts(PROMPTS)
+
+
+@pytest.fixture(scope='module')
+def priority(error_prompts):
+    return priority_categories(error_prompts)
+
+
+def test_priority_categories_come_from_the_prompts(error_prompts, priority):
+    assert priority == [5, 10, 11]
+    assert priority_categories({0: 'prompt', 3: '[priority error] prompt', 'extra': '[priority error]'}) == [3]
+
+
+def test_same_seed_same_triplets(priority):
+    categories, is_priority = sample_error_triplets(1000, priority, min_priority=1, seed=7)
+    again, again_priority = sample_error_triplets(1000, priority, min_priority=1, seed=7)
+    assert np.array_equal(categories, again) and np.array_equal(is_priority, again_priority)
+    assert not np.array_equal(categories, sample_error_triplets(1000, priority, min_priority=1, seed=8)[0])
+
+
+def test_three_distinct_categories_per_report(priority):
+    categories, is_priority = sample_error_triplets(5000, priority, seed=0)
+    assert categories.shape == (5000, ERRORS_PER_REPORT) and categories.dtype == np.int8
+    assert ((categories >= 0) & (categories < len(errors_word_dict))).all()
+    assert all(len(set(row)) == ERRORS_PER_REPORT for row in categories.tolist())
+    assert np.array_equal(is_priority, np.isin(categories, priority))
+    # uniform weights use every category in every slot
+    for slot in range(ERRORS_PER_REPORT):
+        assert len(np.unique(categories[:, slot])) == len(errors_word_dict)
+
+
+@pytest.mark.parametrize('min_priority', [1, 2, 3])
+def test_min_priority_is_met(priority, min_priority):
+    weights = [10.0] * len(errors_word_dict)
+    for category in priority:
+        weights[category] = 0.1
+    categories, is_priority = sample_error_triplets(2000, priority, weights, min_priority=min_priority, seed=1)
+    assert (is_priority.sum(axis=1) >= min_priority).all()
+    # forced priority errors are shuffled over the slots
+    assert is_priority.any(axis=0).all()
+
+
+def test_per_stratum_weights(priority):
+    short = [1.0] * len(errors_word_dict)
+    long = [0.0] * len(errors_word_dict)
+    for category in (0, 3, 6, 9):
+        long[category] = 1.0
+    short[0] = 0.0
+    strata = ['short', 'long'] * 1000
+    categories, _ = sample_error_triplets(len(strata), priority, {'short': short, 'long': long}, strata, seed=2)
+    assert set(np.unique(categories[1::2])) == {0, 3, 6, 9}
+    assert set(np.unique(categories[0::2])) == set(errors_word_dict) - {0}
+
+
+def test_invalid_weights(priority):
+    with pytest.raises(ValueError, match='require strata'):
+        sample_error_triplets(2, priority, {'short': [1.0] * len(errors_word_dict)})
+    with pytest.raises(ValueError, match='No weights for strata'):
+        sample_error_triplets(2, priority, {'short': [1.0] * len(errors_word_dict)}, ['short', 'long'])
+    with pytest.raises(ValueError, match='category weights'):
+        sample_error_triplets(2, priority, [1.0] * 3)
+    with pytest.raises(ValueError, match='at least 3 categories'):
+        sample_error_triplets(2, priority, [1.0, 1.0] + [0.0] * (len(errors_word_dict) - 2))
+    with pytest.raises(ValueError, match='priority categories'):
+        sample_error_triplets(2, priority[:1], min_priority=2)
+
+
+def test_manifest_round_trip(tmp_path, error_prompts, priority):
+    path = str(tmp_path / 'manifest.jsonl')
+    categories, is_priority = sample_error_triplets(50, priority, min_priority=1, seed=3)
+    write_manifest(path, categories, is_priority, {'seed': 3, 'priority': priority})
+
+    header = read_manifest_header(path)
+    assert header['num_reports'] == 50 and header['seed'] == 3 and header['priority'] == priority
+    assert header['categories'] == {str(key): name for key, name in errors_word_dict.items()}
+    assert list(iter_manifest(path)) == [
+        (row, categories[row].tolist(), is_priority[row].tolist()) for row in range(50)
+    ]
+
+    reports = [f"Report {row}." for row in range(50)]
+    jobs = list(iter_generation_jobs(path, iter(reports), error_prompts))
+    assert jobs == [
+        (reports[row], [error_prompts[category] for category in categories[row].tolist()]) for row in range(50)
+    ]
+
+
+def test_manifest_rows_must_match_the_corpus(tmp_path, error_prompts, priority):
+    path = str(tmp_path / 'manifest.jsonl')
+    write_manifest(path, *sample_error_triplets(3, priority, seed=4))
+    with pytest.raises(ValueError, match='fewer rows'):
+        list(iter_generation_jobs(path, ['a', 'b', 'c', 'd'], error_prompts))
+    with pytest.raises(ValueError, match='more rows'):
+        list(iter_generation_jobs(path, ['a', 'b'], error_prompts))
+
+    with open(path) as file:
+        lines = file.readlines()
+    with open(path, 'w') as file:
+        file.writelines([lines[0], lines[2], lines[1], lines[3]])
+    with pytest.raises(ValueError, match='row 1 found where row 0'):
+        list(iter_generation_jobs(path, ['a', 'b', 'c'], error_prompts))
+
+    with open(path, 'w') as file:
+        file.write('{"manifest": "other"}\n')
+    with pytest.raises(ValueError, match='not an error triplet manifest'):
+        read_manifest_header(path)
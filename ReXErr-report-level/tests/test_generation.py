@@ -0,0 +1,141 @@
+import pytest
+from openai.util import convert_to_openai_object
+
+import async_generation
+import batch_generation
+from async_generation import TRUNCATED_ERROR, run_error_generation, run_packed_error_generation
+from generation_cache import GenerationCache, cache_key
+from mock_chat_server import mock_completion
+from utils import parse_error_output, split_packed_output
+
+REPORT = "Heart size is normal. No effusion. Lungs are clear."
+ERRORS = ['error one', 'error two', 'error three']
+
+
+@pytest.mark.parametrize('output, labels', [
+    ("A. B.\n\n{0: [0, '', 0], 1: [1, 'changed severity', 1]}", {0: (0, '', 0), 1: (1, 'changed severity', 1)}),
+    # the format exactly as the prompt spells it
+    ("A. B.\n\n{0: 0, '', 0], 1: 1, 'at 8:55 changed \"mild\"', None]}",
+     {0: (0, '', 0), 1: (1, 'at 8:55 changed "mild"', None)}),
+])
+def test_parse_error_output(output, labels):
+    assert parse_error_output(output) == ('A. B.', labels)
+
+
+@pytest.mark.parametrize('output', [
+    '',
+    "A. B.",
+    "A. B.\n\n{}",
+    "A. B. C.\n\n{0: [0, '', 0], 1: [1, changed severity, 1], 2: [1, 'x', 2]}",  # one entry unparseable
+    "A. B.\n\n{0: [0, '', 0], 1: [1, 'cut off mid",                               # cut off at the token limit
+    "A. B.\n\n{0: 0, '', 0], 1: 1, 'changed', 1]",                                # not closed
+    "A. B.\n\n{0: [2, '', 0]}",
+])
+def test_parse_error_output_rejects(output):
+    with pytest.raises(ValueError):
+        parse_error_output(output)
+
+
+def test_split_packed_output():
+    output = "[[REPORT 2]]\nsecond\n[[END REPORT 2]]\n[[REPORT 1]]\nfirst\n[[END REPORT 1]]\n[[REPORT 3]]\ncut"
+    assert split_packed_output(output, 3) == ['first', 'second', None]
+
+
+def _completion(content, finish_reason='stop'):
+    return convert_to_openai_object({
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+        'usage': {'total_tokens': len(content) // 4},
+    })
+
+
+def _answer(messages, max_tokens):
+    # a well-formed answer to single-report and packed requests
+    return mock_completion({'messages': messages})['choices'][0]['message']['content'], 'stop'
+
+
+class FakeCompletions:
+    """
+    Stand-in for openai.ChatCompletion.acreate; answers come from respond(messages, max_tokens),
+    which returns (content, finish_reason).
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    async def acreate(self, engine, messages, max_tokens):
+        self.calls.append((messages, max_tokens))
+        return _completion(*self.respond(messages, max_tokens))
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    fake = FakeCompletions(_answer)
+    monkeypatch.setattr(async_generation.openai.ChatCompletion, 'acreate', fake.acreate)
+    return fake
+
+
+def test_truncated_completion_fails(completions):
+    completions.respond = lambda messages, max_tokens: (_answer(messages, max_tokens)[0][:-5], 'length')
+    result, = run_error_generation([(REPORT, ERRORS)], concurrency=1)
+    assert (result.output, result.error, result.attempts) == (None, TRUNCATED_ERROR, 1)
+
+
+def test_truncated_pack_is_requeued_as_single_requests(completions):
+    def respond(messages, max_tokens):
+        if '[[REPORT 1]]' in messages[-1]['content']:
+            return "[[REPORT 1]]\nA.\n\n{0: [0, '', 0]}\n[[END REPORT 1]]\n[[REPORT 2]]\nB.", 'length'
+        return _answer(messages, max_tokens)
+
+    completions.respond = respond
+    results = run_packed_error_generation([('A.', ERRORS), ('B.', ERRORS)], concurrency=1)
+    assert [(result.error, result.error_report) for result in results] == [(None, 'A.'), (None, 'B.')]
+    assert len(completions.calls) == 3
+
+
+def test_batch_result_cut_off_at_max_tokens():
+    body = _completion("A.\n\n{0: [0, '', 0]}", 'length').to_dict_recursive()
+    result = {'custom_id': 'job-0000000-0', 'response': {'status_code': 200, 'body': body}, 'error': None}
+    output, failure = batch_generation._result_outcome(result)
+    assert output is None and failure.startswith('malformed')
+
+
+def test_unparseable_output_is_a_failure_and_not_cached(completions, tmp_path):
+    jobs = [(REPORT, ERRORS)]
+    with GenerationCache(str(tmp_path / 'cache.db')) as cache:
+        completions.respond = lambda messages, max_tokens: (messages[-1]['content'], 'stop')
+        result, = run_error_generation(jobs, concurrency=1, cache=cache)
+        assert (result.output, result.attempts, result.labels) == (REPORT, 1, None)
+        assert result.error.startswith('ParseError')
+        assert cache.stats()['entries'] == 0
+
+        completions.respond = _answer
+        result, = run_error_generation(jobs, concurrency=1, cache=cache)
+        assert (result.error, result.attempts, result.error_report) == (None, 1, REPORT)
+        result, = run_error_generation(jobs, concurrency=1, cache=cache)
+        assert (result.error, result.attempts, result.error_report) == (None, 0, REPORT)
+        assert len(completions.calls) == 2
+
+
+def test_unparseable_cache_entry_is_generated_again(completions, tmp_path):
+    with GenerationCache(str(tmp_path / 'cache.db')) as cache:
+        cache.put(cache_key(REPORT, ERRORS), REPORT)
+        for run in (run_error_generation, run_packed_error_generation):
+            result, = run([(REPORT, ERRORS)], concurrency=1, cache=cache)
+            assert (result.error, result.attempts, result.error_report) == (None, 1, REPORT)
+            cache.put(cache_key(REPORT, ERRORS), REPORT)
+
+
+def test_packed_outputs_are_not_reused_by_single_report_runs(completions, tmp_path):
+    jobs = [('A.', ERRORS), ('B.', ERRORS)]
+    assert cache_key('A.', ERRORS) != cache_key('A.', ERRORS, packed_prompt_version=1)
+    with GenerationCache(str(tmp_path / 'cache.db')) as cache:
+        assert [result.attempts for result in run_packed_error_generation(jobs, concurrency=1, cache=cache)] == [1, 1]
+        assert len(completions.calls) == 1
+        # a packed rerun is served from the cache, a single-report run is not
+        assert [result.attempts for result in run_packed_error_generation(jobs, concurrency=1, cache=cache)] == [0, 0]
+        assert [result.attempts for result in run_error_generation(jobs, concurrency=1, cache=cache)] == [1, 1]
+        assert len(completions.calls) == 3
+        # single-report outputs are used by packed runs
+        run_error_generation([('C.', ERRORS)], concurrency=1, cache=cache)
+        assert [result.attempts for result in run_packed_error_generation([('C.', ERRORS)], cache=cache)] == [0]
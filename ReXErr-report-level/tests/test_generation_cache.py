@@ -0,0 +1,116 @@
+import itertools
+import sqlite3
+
+import pytest
+
+import generation_cache
+from generation_cache import GenerationCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # strictly increasing timestamps, so least recently used order never depends on timer resolution
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(generation_cache.time, 'time', lambda: float(next(ticks)))
+
+
+def _keys(path):
+    with sqlite3.connect(path) as connection:
+        return {key for key, in connection.execute('SELECT key FROM generations')}
+
+
+def _last_access(path, key):
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT last_access FROM generations WHERE key = ?', (key,)).fetchone()[0]
+
+
+def test_get_put_and_counts(tmp_path):
+    with GenerationCache(str(tmp_path / 'cache.db')) as cache:
+        assert cache.get('a') is None
+        cache.put('a', 'output a')
+        assert cache.get('a') == 'output a'
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1, 'bytes': 8}
+
+
+def test_entry_cap_evicts_to_low_water(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    with GenerationCache(path, max_entries=10, low_water=0.5) as cache:
+        for number in range(10):
+            cache.put(f'k{number}', 'x')
+        # at the cap, nothing is evicted
+        assert cache.stats()['entries'] == 10
+        cache.put('k10', 'x')
+        assert _keys(path) == {f'k{number}' for number in range(6, 11)}
+        assert (cache._entries, cache._bytes) == (5, 5)
+
+
+def test_byte_cap_keeps_most_recently_used(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    with GenerationCache(path, max_bytes=100, low_water=0.9) as cache:
+        for number in range(3):
+            cache.put(f'k{number}', 'x' * 30)
+        assert cache.get('k0') is not None
+        cache.put('k3', 'x' * 30)
+        # 120 bytes > 100: trimmed to at most 90 bytes, least recently used first (k1)
+        assert _keys(path) == {'k0', 'k2', 'k3'}
+        assert cache.stats()['bytes'] == 90
+
+
+def test_replace_keeps_running_totals(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    with GenerationCache(path, max_entries=2, max_bytes=25) as cache:
+        cache.put('a', 'x' * 10)
+        cache.put('b', 'x' * 10)
+        for size in (5, 12, 10):
+            cache.put('a', 'x' * size)
+        assert _keys(path) == {'a', 'b'}
+        assert (cache._entries, cache._bytes) == (2, 20)
+        cache.put('a', 'x' * 20)
+        # replacing with a larger output goes over max_bytes and evicts the older entry
+        assert _keys(path) == {'a'}
+        assert (cache._entries, cache._bytes) == (1, 20) == (cache.stats()['entries'], cache.stats()['bytes'])
+
+
+def test_access_times_are_buffered(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    with GenerationCache(path, access_flush_size=3) as cache:
+        for key in 'abc':
+            cache.put(key, 'x')
+        written = _last_access(path, 'a')
+        cache.get('a')
+        cache.get('b')
+        assert _last_access(path, 'a') == written
+        cache.get('c')
+        assert _last_access(path, 'a') > written
+        cache.get('a')
+        assert len(cache._accessed) == 1
+        cache.flush()
+        assert not cache._accessed
+
+
+def test_eviction_sees_buffered_hits(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    with GenerationCache(path, max_entries=3, low_water=0.7) as cache:
+        for key in 'abc':
+            cache.put(key, 'x')
+        cache.get('a')
+        cache.put('d', 'x')
+        assert _keys(path) == {'a', 'd'}
+
+
+def test_shared_database_totals(tmp_path, clock):
+    path = str(tmp_path / 'cache.db')
+    first = GenerationCache(path, max_entries=4, low_water=0.5)
+    second = GenerationCache(path, max_entries=4, low_water=0.5)
+    first.put('a', 'x')
+    first.put('b', 'x')
+    second.put('c', 'x')
+    second.put('d', 'x')
+    # first only saw its own puts and is still under its cap, but evicts from the actual totals
+    first.put('e', 'x')
+    assert first._entries == 3
+    assert first.evict() == 3
+    assert _keys(path) == {'d', 'e'}
+    assert first._entries == 2
+    first.close()
+    second.close()
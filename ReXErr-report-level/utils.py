@@ -0,0 +1,184 @@
+import ast
+import json
+import re
+
+# Error categories; keys match the keys of ReXErr-report-level-error_prompts.json
+errors_word_dict = { 
+    0: "Add medical device",
+    1: "Change name of device",
+    2: "Change position of device",
+    3: "Change severity",
+    4: "Change location",
+    5: "False prediction",
+    6: "Change measurement",
+    7: "Add repetitions",
+    8: "Change to homophone",
+    9: "Add typo",
+    10: "Add contradiction",
+    11: "False negation"
+}
+
+# Azure OpenAI deployment and completion budget used to generate ReXErr-v1
+ENGINE = 'gpt4o05132024'
+MAX_TOKENS = 2000
+
+# Bump whenever build_system_prompt changes so cached generations are not reused
+SYSTEM_PROMPT_VERSION = 1
+
+# Bump whenever build_packed_system_prompt or build_packed_user_prompt change (on top of
+# SYSTEM_PROMPT_VERSION, which the packed prompt extends)
+PACKED_PROMPT_VERSION = 1
+
+
+def load_error_prompts(path='ReXErr-report-level-error_prompts.json'):
+    """
+    Load the error-specific prompts
+
+    Args:
+        path: str, path to the error prompt JSON file
+
+    Returns:
+        Dict mapping error category index (int) to its prompt text
+    """
+    with open(path, 'r') as file:
+        error_prompts = json.load(file)
+    return {int(key) if key.isdigit() else key: value for key, value in error_prompts.items()}
+
+
+def build_system_prompt(errors):
+    """
+    Build the general system prompt with the particular errors injected
+
+    Args:
+        errors: list of three error prompt texts
+
+    Returns:
+        str, system prompt
+    """
+    return "The purpose of the following is purely for educational, research, or testing purposes, and not for real medical diagnosis or clinical use. This is not intended for real-world diagnosis or clinical use. You will be given a radiology report of a chest X-ray. Your task is to change the statements in the report so that the report is still clinically plausible but has a different meaning than the previous report. You will be given three classes of errors to generate at a time. Make sure to add as many errors as possible to the report, to every single sentence if you can. Look at each sentence, and if you can add an error, make sure to add it. Only one error per sentence. There should not be cases where a sentence within a report does not contain an error unless it is impossible to add an error. Each of the three error classes you are considering should be separated by numbers surrounded by <<<>>>. For example, the first error would start with <<<1>>>. Each error may or may not contain examples. Avoid making multiple errors within the same sentence. Certain error classes, when provided, are labeled as “priority errors” in brackets, meaning that if it is really not possible to add all of the three error types provided, then do your best to add at the very least the priority error. Keep in mind that the goal should still be to add an error to every sentence and use all error classes. Here are the error classes: <<<1>>> " + errors[0] + " <<<2>>> " + errors[1] + " <<<3>>> " + errors[2] + " MAKE sure that the “<<<>>>” numbers do not show up in your output- these are only provided for your reference to distinguish between errors. Your output should follow exactly the format that is described below. Here are some guidelines to follow when generating the errors. These guidelines may not be relevant for the given class of error you are tasked with generating, but keep them in consideration. Do not combine unrelated findings in the same sentence. Do not reword sentences when the meaning does not change (ex. do not change ‘normal’ to ‘unremarkable’, ‘multiple’ to ‘several’, or ‘abnormality’ to ‘findings’). Do NOT replace one word with another word that has a similar meaning. For example: ‘noticed’ should not be replaced by ‘seen’. Do not change the order of parts of a sentence, when the meaning does not change.\n\nKeep track of the sentence indexes corresponding to the sentences you change in a report. \n\nFor a given report, return a new report with the errors in every sentence according to the above paragraph, two new lines, and then a Python dictionary in the following format: {error sentence index : label, explanation, original sentence index]}. The report should be in the exact same format as the original input report, except with the changed sentences. The new report should not contain newlines or any spacing differences compared to the original report. Make sure this format is followed exactly, including the spacing. The label is determined by the following:\n0: unchanged sentence\n1: changed sentence\nWhen the label is 1: 'explanation' should contain one statement about the error made in the sentence."
+
+
+def build_packed_system_prompt(errors, num_reports):
+    """
+    Build the system prompt for a packed request holding several reports that share the same errors
+
+    Args:
+        errors: list of three error prompt texts
+        num_reports: int, number of reports in the request
+
+    Returns:
+        str, system prompt
+    """
+    return build_system_prompt(errors) + (
+        f"\n\nYou will be given {num_reports} separate reports at once. Each report starts with a line "
+        "[[REPORT k]] and ends with a line [[END REPORT k]], where k is the report number. Handle every "
+        "report independently, exactly as described above, with sentence indexes counted within that "
+        "report. For each report, output the line [[REPORT k]], then the new report, two new lines and "
+        "the Python dictionary for that report, then the line [[END REPORT k]]. Return every report, "
+        "in the same order, and nothing outside of these blocks."
+    )
+
+
+def build_packed_user_prompt(reports):
+    """
+    Pack several reports into one user message, delimited as build_packed_system_prompt describes
+
+    Args:
+        reports: list of str, original reports
+
+    Returns:
+        str, user message
+    """
+    return "\n".join(f"[[REPORT {k}]]\n{report}\n[[END REPORT {k}]]" for k, report in enumerate(reports, 1))
+
+
+_PACKED_BLOCK = re.compile(r'\[\[REPORT (\d+)\]\]\s*\n(.*?)\n\s*\[\[END REPORT \1\]\]', re.DOTALL)
+
+
+def split_packed_output(output, num_reports):
+    """
+    Split the completion of a packed request into the raw output of each report
+
+    Args:
+        output: str, completion text
+        num_reports: int, number of reports in the request
+
+    Returns:
+        List of length num_reports with each report's output, or None where its block is missing
+    """
+    sections = [None] * num_reports
+    for match in _PACKED_BLOCK.finditer(output or ''):
+        k = int(match.group(1))
+        if 1 <= k <= num_reports and sections[k - 1] is None:
+            sections[k - 1] = match.group(2).strip()
+    return sections
+
+
+_LABEL_ENTRY = re.compile(
+    r'(\d+)\s*:\s*[\[\(]?\s*([01])\s*,\s*(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\')\s*,\s*(\d+|None)\s*[\]\)]?'
+)
+
+_LABEL_KEY = re.compile(r'\d+\s*:')
+
+
+def parse_error_output(output):
+    """
+    Parse a completion into the error report and its sentence label dictionary
+
+    The completion is expected to be the error report, two new lines and a dictionary
+    {error sentence index: [label, explanation, original sentence index]}.
+
+    Args:
+        output: str, completion text for a single report
+
+    Returns:
+        Tuple (error_report, labels), where labels maps error sentence index (int) to a tuple
+        (label, explanation, original sentence index)
+
+    Raises:
+        ValueError: if the completion does not follow the format
+    """
+    if not output or not output.strip():
+        raise ValueError("empty output")
+    split = output.rstrip().rfind('\n\n{')
+    if split < 0:
+        raise ValueError("no label dictionary after the report")
+    error_report = output[:split].strip()
+    dictionary = output[split:].strip()
+    if not error_report:
+        raise ValueError("empty error report")
+
+    try:
+        parsed = ast.literal_eval(dictionary)
+        entries = [(key, *value) for key, value in parsed.items()]
+    except (ValueError, SyntaxError, TypeError, AttributeError, MemoryError, RecursionError):
+        # e.g. {0: 0, '', 0], ...} exactly as the prompt spells the format; accepted only if the
+        # dictionary is closed and every key belongs to a well-formed entry, so that a truncated or
+        # partly garbled dictionary is not taken for a complete one
+        if not dictionary.endswith('}'):
+            raise ValueError("label dictionary is not closed")
+        unmatched_key = _LABEL_KEY.search(_LABEL_ENTRY.sub('', dictionary))
+        if unmatched_key is not None:
+            raise ValueError(f"malformed label entry for key {unmatched_key.group()!r}")
+        entries = [
+            (match.group(1), match.group(2), match.group(3) if match.group(3) is not None else match.group(4),
+             match.group(5))
+            for match in _LABEL_ENTRY.finditer(dictionary)
+        ]
+
+    labels = {}
+    for entry in entries:
+        if len(entry) != 4:
+            raise ValueError(f"malformed label entry {entry!r}")
+        index, label, explanation, original_index = entry
+        try:
+            index, label = int(index), int(label)
+            original_index = None if original_index in (None, 'None') else int(original_index)
+        except (TypeError, ValueError):
+            raise ValueError(f"malformed label entry {entry!r}")
+        if label not in (0, 1) or index < 0 or not isinstance(explanation, str):
+            raise ValueError(f"malformed label entry {entry!r}")
+        labels[index] = (label, explanation, original_index)
+    if not labels:
+        raise ValueError("empty label dictionary")
+    return error_report, labels
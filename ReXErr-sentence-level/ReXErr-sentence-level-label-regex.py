@@ -1,81 +1,342 @@
 
-import re
-from utils import devices_pattern, location_pattern, severity_pattern, false_negation, prior_pattern, measurement_pattern, get_nouns, find_homophones_and_typos
-
-def label_errors(original_sentence, error_sentence, original_report, error_report):
-    def get_label(has_prior, is_match=False):
-        if is_match and not has_prior:
-            return 0
-        return 2 if has_prior else 1
-    
+import hashlib
+import importlib
+from collections import Counter
+from itertools import repeat
+
+import numpy as np
+
+import instrumentation
+from instrumentation import timer
+from utils import lexicon_scanner, sentence_features, find_feature_homophones_and_typos
+
+# the splicing script has a hyphenated file name, so it is loaded through importlib
+splicing = importlib.import_module('ReXErr-sentence-level-splicing')
+
+
+def _normalize(text):
+    return text.strip().replace('\n', ' ')
+
+
+class ReportIndex:
+    """
+    Normalized original report and the set of its normalized sentences, built once per report.
+
+    `sentence in index` answers the "Add repetition" check of label_errors: a hash lookup for
+    sentences copied verbatim from the report, falling back to a substring search of the
+    normalized report otherwise.
+
+    The fallback is kept because label_errors has always treated any substring of the report
+    (e.g. the tail of a longer sentence) as a repetition, so a miss is still O(len(report)). It is
+    a single C-level str search (well under a microsecond for a typical report); exact
+    alternatives such as an n-gram index of the report cost far more to build than they save.
+    """
+    __slots__ = ('text', 'sentences')
+
+    def __init__(self, report, sentences=None):
+        """
+        Args:
+            report: str, original report
+            sentences: list of str, sentences of the report (split with split_sentences if not given)
+        """
+        if sentences is None:
+            sentences = splicing.split_sentences(report)
+        self.text = _normalize(report)
+        self.sentences = frozenset(_normalize(sentence) for sentence in sentences)
+
+    def __contains__(self, sentence):
+        sentence = _normalize(sentence)
+        return sentence in self.sentences or sentence in self.text
+
+
+def _get_label(has_prior, is_match=False):
+    if is_match and not has_prior:
+        return 0
+    return 2 if has_prior else 1
+
+
+def _label_pair(orig_sentence, err_sentence):
+    # Label and error type of one sentence pair, without the "Add repetition" check
+    # Features (regex hits, POS tags, metaphones) are shared with match_sentences via the cache
+    orig_features = sentence_features(orig_sentence)
+    err_features = sentence_features(err_sentence)
+
+    # Check for prior words in either sentence
+    has_prior = orig_features.has_prior or err_features.has_prior
+
+    # Handle empty original sentence cases
+    if orig_sentence == '':
+        if err_features.devices:
+            error_type = "Add medical device"
+        else:
+            error_type = "False prediction"
+        label = _get_label(has_prior)
+
+    # Handle empty error sentence
+    elif err_sentence == '':
+        error_type = "False negation"
+        label = _get_label(has_prior)
+
+    # Handle false negation cases
+    elif err_features.has_negation and not orig_features.has_negation:
+        error_type = "False negation"
+        label = _get_label(has_prior)
+
+    # Handle matching sentences
+    elif orig_sentence == err_sentence:
+        error_type = "Not applicable"
+        label = _get_label(has_prior, is_match=True)
+
+    # Handle all other cases
+    else:
+        # Extract features
+        locations_original = orig_features.locations
+        locations_error = err_features.locations
+        severity_original = orig_features.severities
+        severity_error = err_features.severities
+        devices_original = orig_features.devices
+        devices_error = err_features.devices
+        measurement_original = orig_features.measurements
+        measurement_error = err_features.measurements
+
+        with timer('find_homophones_and_typos'):
+            results = find_feature_homophones_and_typos(orig_features, err_features)
+
+        # Determine error type
+        if results['homophones'] or results['typos']:
+            error_type = "Change to homophone" if len(results['homophones']) > len(results['typos']) else "Add typo"
+        elif devices_original != devices_error:
+            error_type = "Change name of device"
+        elif len(devices_error) > 0 and locations_original != locations_error:
+            error_type = "Change position of device"
+        elif locations_original != locations_error:
+            error_type = "Change location"
+        elif severity_original != severity_error:
+            error_type = "Change severity"
+        elif measurement_original != measurement_error:
+            error_type = "Change measurement"
+        else:
+            error_type = "False prediction"
+
+        label = _get_label(has_prior)
+
+    return label, error_type
+
+
+def label_errors(original_sentence, error_sentence, original_report, error_report, report_index=None, memo=None):
+    """
+    Label aligned (original, error) sentence pairs with an error label and error type.
+
+    Args:
+        original_sentence: list of str, original sentences ('' where a sentence was added)
+        error_sentence: list of str, error sentences ('' where a sentence was removed)
+        original_report: str, original report
+        error_report: str, error report
+        report_index: ReportIndex of original_report, built on first use if not given
+        memo: optional label_memo.LabelMemo; pairs found in it skip feature comparison and the
+            homophone/typo search (the "Add repetition" check is always done against the report)
+
+    Returns:
+        Tuple of two lists: labels (0 no error, 1 error, 2 references a prior study) and error types
+    """
     label_list, error_list = [], []
     for orig_sentence, err_sentence in zip(original_sentence, error_sentence):
-        # Check for prior words in either sentence
-        has_prior = (re.search(prior_pattern, orig_sentence, re.IGNORECASE) if orig_sentence else False) or \
-                    (re.search(prior_pattern, err_sentence, re.IGNORECASE) if err_sentence else False)
-        
-        # Handle empty original sentence cases
+        result = memo.get(orig_sentence, err_sentence) if memo is not None else None
+        memo_hit = result is not None
+        if result is None:
+            result = _label_pair(orig_sentence, err_sentence)
+            if memo is not None:
+                memo.put(orig_sentence, err_sentence, *result)
+        label, error_type = result
+
+        # An added sentence that already appears in the original report is a repetition
         if orig_sentence == '':
-            if err_sentence.strip().replace('\n', ' ') in original_report.strip().replace('\n', ' '):
+            if report_index is None:
+                report_index = ReportIndex(original_report, sentences=())
+            if err_sentence in report_index:
                 error_type = "Add repetition"
-            elif re.search(devices_pattern, err_sentence, re.IGNORECASE):
-                error_type = "Add medical device"
-            else:
-                error_type = "False prediction"
-            label = get_label(has_prior)
-            
-        # Handle empty error sentence
-        elif err_sentence == '':
-            error_type = "False negation"
-            label = get_label(has_prior)
-            
-        # Handle false negation cases
-        elif re.search(false_negation, err_sentence) and not re.search(false_negation, orig_sentence):
-            error_type = "False negation"
-            label = get_label(has_prior)
-            
-        # Handle matching sentences
-        elif orig_sentence == err_sentence:
-            error_type = "Not applicable"
-            label = get_label(has_prior, is_match=True)
-            
-        # Handle all other cases
-        else:
-            # Extract features
-            locations_original = re.findall(location_pattern, orig_sentence, re.IGNORECASE)
-            locations_error = re.findall(location_pattern, err_sentence, re.IGNORECASE)
-            severity_original = re.findall(severity_pattern, orig_sentence, re.IGNORECASE)
-            severity_error = re.findall(severity_pattern, err_sentence, re.IGNORECASE)
-            devices_original = re.findall(devices_pattern, orig_sentence, re.IGNORECASE)
-            devices_error = re.findall(devices_pattern, err_sentence, re.IGNORECASE)
-            measurement_original = re.findall(measurement_pattern, orig_sentence, re.IGNORECASE)
-            measurement_error = re.findall(measurement_pattern, err_sentence, re.IGNORECASE)
-            
-            results = find_homophones_and_typos(orig_sentence, err_sentence)
-            
-            # Determine error type
-            if results['homophones'] or results['typos']:
-                error_type = "Change to homophone" if len(results['homophones']) > len(results['typos']) else "Add typo"
-            elif devices_original != devices_error:
-                error_type = "Change name of device"
-            elif len(devices_error) > 0 and locations_original != locations_error:
-                error_type = "Change position of device"
-            elif locations_original != locations_error:
-                error_type = "Change location"
-            elif severity_original != severity_error:
-                error_type = "Change severity"
-            elif measurement_original != measurement_error:
-                error_type = "Change measurement"
-            else:
-                error_type = "False prediction"
-
-            
-            label = get_label(has_prior)
 
         label_list.append(label)
         error_list.append(error_type)
 
-    return label_list, error_list      
+        if instrumentation.enabled():
+            branch = 'added.' if orig_sentence == '' else 'removed.' if err_sentence == '' else ''
+            instrumentation.count('label_errors.' + branch + error_type)
+            if memo is not None:
+                instrumentation.count('label_memo.hits' if memo_hit else 'label_memo.misses')
+
+    return label_list, error_list
+
+
+# Pattern family -> the SentenceFeatures/PatternHits field label_errors reads it through
+FAMILY_FIELDS = {
+    'prior': 'has_prior',
+    'false_negation': 'has_negation',
+    'devices': 'devices',
+    'location': 'locations',
+    'severity': 'severities',
+    'measurement': 'measurements',
+}
+
+
+def label_dependencies(orig_sentence, err_sentence, error_type):
+    """
+    Pattern families whose hits label_errors consulted to label a sentence pair.
+
+    Follows the branches of label_errors for the outcome it produced: if the hits of these
+    families are unchanged for both sentences, label_errors takes the same branches and returns
+    the same label and error type.
+
+    Args:
+        orig_sentence: str, original sentence
+        err_sentence: str, error sentence
+        error_type: str, error type assigned by label_errors
+
+    Returns:
+        Tuple of pattern family names
+    """
+    if orig_sentence == '':
+        # the repetition check does not depend on the patterns
+        return ('prior',) if error_type == "Add repetition" else ('prior', 'devices')
+    if err_sentence == '':
+        return ('prior',)
+    if error_type in ("False negation", "Not applicable", "Change to homophone", "Add typo"):
+        return ('prior', 'false_negation')
+    chain = ['devices', 'location', 'severity', 'measurement']
+    stop = {
+        "Change name of device": 1,
+        "Change position of device": 2,
+        "Change location": 2,
+        "Change severity": 3,
+        "Change measurement": 4,
+    }.get(error_type, len(chain))
+    return ('prior', 'false_negation') + tuple(chain[:stop])
+
+
+def hit_digest(orig_features, err_features, families):
+    """
+    Digest of the pattern hits a labeled sentence pair depended on.
+
+    Args:
+        orig_features: SentenceFeatures or PatternHits of the original sentence
+        err_features: SentenceFeatures or PatternHits of the error sentence
+        families: tuple of pattern family names from label_dependencies
+
+    Returns:
+        str, 16 hex digit digest
+    """
+    hits = [
+        (family, getattr(orig_features, FAMILY_FIELDS[family]), getattr(err_features, FAMILY_FIELDS[family]))
+        for family in families
+    ]
+    return hashlib.blake2b(repr(hits).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def pair_hit_digest(orig_sentence, err_sentence, error_type):
+    """
+    hit_digest of a labeled pair, using the (cached) sentence features
+
+    Args:
+        orig_sentence: str, original sentence
+        err_sentence: str, error sentence
+        error_type: str, error type assigned by label_errors
+
+    Returns:
+        str, 16 hex digit digest
+    """
+    families = label_dependencies(orig_sentence, err_sentence, error_type)
+    return hit_digest(sentence_features(orig_sentence), sentence_features(err_sentence), families)
+
+
+def label_report_pairs(report_pairs, memo=None):
+    """
+    Split, align and label a batch of report pairs, building one ReportIndex per original report.
+
+    Args:
+        report_pairs: iterable of (original report, error report) tuples
+        memo: optional label_memo.LabelMemo shared by all pairs, see label_errors
+
+    Returns:
+        List of tuples (original sentences, error sentences, labels, error types), one per report pair
+    """
+    results = []
+    for original_report, error_report in report_pairs:
+        sentences1, sentences2, alignment = splicing.align_reports(original_report, error_report)
+        original_sentences = [sentences1[i] if i >= 0 else '' for i in alignment[:, 0].tolist()]
+        error_sentences = [sentences2[j] if j >= 0 else '' for j in alignment[:, 1].tolist()]
+        with timer('label_errors'):
+            labels, error_types = label_errors(original_sentences, error_sentences, original_report, error_report,
+                                               report_index=ReportIndex(original_report, sentences1), memo=memo)
+        results.append((original_sentences, error_sentences, labels, error_types))
+    return results
+
+
+def label_errors_frame(frame, report_column='original_report', memo=None):
+    """
+    Label a pandas DataFrame of aligned sentence pairs, with the same results as label_errors.
+
+    The cheap branches of label_errors (added sentence, removed sentence, false negation, exact
+    match, and the prior flag of every label) are evaluated for all rows at once with pandas
+    string/regex ops, without tokenizing or tagging. Only the remaining rows go through
+    label_errors for the feature comparison and homophone/typo search.
+
+    Args:
+        frame: DataFrame with original_sentence and error_sentence columns (missing values count as '')
+        report_column: str, column with the original report of each pair, used by the "Add repetition"
+            check of added sentences; without it, added sentences are labeled as with an empty report
+        memo: optional label_memo.LabelMemo used for the rows that go through label_errors
+
+    Returns:
+        Copy of frame with error_present (label) and error_type columns
+    """
+    original = frame['original_sentence'].fillna('').astype(str)
+    error = frame['error_sentence'].fillna('').astype(str)
+    prior = lexicon_scanner.regex('prior')
+    negation = lexicon_scanner.regex('false_negation')
+
+    has_prior = (original.str.contains(prior) | error.str.contains(prior)).to_numpy(dtype=bool)
+    added = (original == '').to_numpy()
+    removed = ~added & (error == '').to_numpy()
+    negated = (~added & ~removed & error.str.contains(negation).to_numpy(dtype=bool)
+               & ~original.str.contains(negation).to_numpy(dtype=bool))
+    matched = ~added & ~removed & ~negated & (original == error).to_numpy()
+    rest = ~(added | removed | negated | matched)
+
+    labels = np.where(has_prior, 2, np.where(matched, 0, 1))
+    error_types = np.full(len(frame), "False prediction", dtype=object)
+    error_types[removed | negated] = "False negation"
+    error_types[matched] = "Not applicable"
+
+    added_rows = np.flatnonzero(added)
+    if len(added_rows):
+        added_errors = error.iloc[added_rows]
+        has_devices = added_errors.str.contains(lexicon_scanner.regex('devices')).to_numpy(dtype=bool)
+        error_types[added_rows[has_devices]] = "Add medical device"
+        if report_column in frame:
+            reports = frame[report_column].fillna('').astype(str).iloc[added_rows]
+        else:
+            reports = repeat('')
+        report_indexes = {}
+        for row, err_sentence, report in zip(added_rows.tolist(), added_errors, reports):
+            report_index = report_indexes.get(report)
+            if report_index is None:
+                report_index = report_indexes[report] = ReportIndex(report, sentences=())
+            if err_sentence in report_index:
+                error_types[row] = "Add repetition"
+
+    if instrumentation.enabled():
+        branches = np.where(added, 'added.', np.where(removed, 'removed.', ''))
+        for (branch, error_type), amount in Counter(zip(branches[~rest], error_types[~rest])).items():
+            instrumentation.count('label_errors.' + branch + error_type, amount)
+
+    rest_rows = np.flatnonzero(rest)
+    if len(rest_rows):
+        rest_labels, rest_error_types = label_errors(original.iloc[rest_rows].tolist(), error.iloc[rest_rows].tolist(),
+                                                     '', '', memo=memo)
+        labels[rest_rows] = rest_labels
+        error_types[rest_rows] = rest_error_types
+
+    return frame.assign(error_present=labels, error_type=error_types)
 
 if __name__ == "__main__":
     
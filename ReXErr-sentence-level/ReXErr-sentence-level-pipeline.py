@@ -0,0 +1,401 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+import instrumentation
+from columnar_output import ID_COLUMNS, LABEL_COLUMNS, LabelWriter
+from label_memo import LABEL_MEMO_SIZE, LabelMemo
+from utils import PATTERN_VERSION, clear_caches, warmup
+
+# the labeling script has a hyphenated file name, so it is loaded through importlib
+labeling = importlib.import_module('ReXErr-sentence-level-label-regex')
+
+OUTPUT_COLUMNS = LABEL_COLUMNS
+
+# Per-worker memo of sentence pair labels, set up by _init_worker
+_label_memo = None
+# Memo lookup counts of this worker already returned with earlier chunks
+_memo_counts_returned = {}
+
+
+def read_report_pairs(path):
+    """
+    Stream (original, error) report records from a ReXErr report-level CSV or JSONL file.
+
+    Args:
+        path: str, path to a .csv or .jsonl file with original_report and error_report columns
+
+    Returns:
+        Iterator of dicts, one per report
+    """
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        with open(path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, 'r', newline='') as file:
+            yield from csv.DictReader(file)
+
+
+def _report_pair(record):
+    return record.get('original_report') or '', record.get('error_report') or ''
+
+
+def _output_rows(record, result):
+    original_sentences, error_sentences, labels, error_types = result
+    ids = [record.get(column, '') for column in ID_COLUMNS]
+    return [
+        ids + [original_sentence, error_sentence, label, error_type, PATTERN_VERSION,
+               labeling.pair_hit_digest(original_sentence, error_sentence, error_type)]
+        for original_sentence, error_sentence, label, error_type
+        in zip(original_sentences, error_sentences, labels, error_types)
+    ]
+
+
+def process_report(record):
+    """
+    Split, match, combine and label a single report pair.
+
+    Args:
+        record: dict, report-level record with original_report and error_report
+
+    Returns:
+        List of output rows (lists ordered as OUTPUT_COLUMNS), one per aligned sentence pair
+    """
+    return _output_rows(record, labeling.label_report_pairs([_report_pair(record)], memo=_label_memo)[0])
+
+
+def process_chunk(records):
+    """
+    Process a chunk of report records inside a worker process.
+
+    Args:
+        records: list of dicts, report-level records
+
+    Returns:
+        Tuple (output rows for the whole chunk in input order, dict of label memo lookup counts for the
+        chunk or None without a memo)
+    """
+    results = labeling.label_report_pairs([_report_pair(record) for record in records], memo=_label_memo)
+    rows = []
+    for record, result in zip(records, results):
+        rows.extend(_output_rows(record, result))
+    return rows, _finish_memo_chunk()
+
+
+def process_chunk_instrumented(records):
+    """
+    Process a chunk of report records with instrumentation enabled, timing every report.
+
+    Args:
+        records: list of dicts, report-level records
+
+    Returns:
+        Tuple (output rows for the whole chunk, dict of label memo lookup counts for the chunk or None
+        without a memo, dict of the stats collected for the chunk)
+    """
+    rows = []
+    for record in records:
+        original_report, error_report = _report_pair(record)
+        start = perf_counter()
+        result = labeling.label_report_pairs([(original_report, error_report)], memo=_label_memo)[0]
+        instrumentation.add_report(perf_counter() - start, str(record.get('study_id', '')),
+                                   original_report, error_report)
+        rows.extend(_output_rows(record, result))
+    return rows, _finish_memo_chunk(), instrumentation.collect().to_dict()
+
+
+def _finish_memo_chunk():
+    # Flush new labels to the shared store and return the lookups made since the previous chunk
+    global _memo_counts_returned
+    if _label_memo is None:
+        return None
+    _label_memo.flush()
+    counts = {key: getattr(_label_memo, key) for key in ('hits', 'store_hits', 'misses')}
+    chunk_counts = {key: counts[key] - _memo_counts_returned.get(key, 0) for key in counts}
+    _memo_counts_returned = counts
+    return chunk_counts
+
+
+def _profile_report(original_report, error_report):
+    labeling.label_report_pairs([(original_report, error_report)])
+
+
+def _init_worker(slowest=None, label_memo_path=None, label_memo_size=0):
+    # Load the NLTK tokenizer, tagger and WordNet once per worker instead of on the first report
+    global _label_memo
+    warmup()
+    if slowest is not None:
+        instrumentation.enable(slowest)
+    if label_memo_size or label_memo_path:
+        _label_memo = LabelMemo(label_memo_path, max_entries=label_memo_size)
+
+
+def _chunks(records, chunk_size):
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load the checkpoint of a previous run, if any.
+
+    Args:
+        checkpoint_path: str, path of the checkpoint JSON file
+
+    Returns:
+        Dict with 'format', 'reports_done' and 'output_bytes' (CSV) or 'parts' (Parquet/Arrow),
+        or None when there is no checkpoint
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as file:
+        return json.load(file)
+
+
+def save_checkpoint(checkpoint_path, state):
+    """
+    Atomically write the checkpoint state.
+
+    Args:
+        checkpoint_path: str, path of the checkpoint JSON file
+        state: dict, checkpoint state
+    """
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+class _CsvOutput:
+    # Single CSV file, checkpointed after every chunk by its size
+
+    def __init__(self, path, state, resume):
+        if resume:
+            # drop any rows written after the last checkpoint
+            with open(path, 'r+b') as file:
+                file.truncate(state['output_bytes'])
+        else:
+            with open(path, 'w', newline='') as file:
+                csv.writer(file).writerow(OUTPUT_COLUMNS)
+                state['output_bytes'] = file.tell()
+        self.state = state
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+
+    def write(self, rows, num_reports):
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.state['reports_done'] += num_reports
+        self.state['output_bytes'] = self.file.tell()
+        return True
+
+    def finish(self):
+        return False
+
+    def close(self):
+        self.file.close()
+
+
+class _PartitionedOutput:
+    # Directory of Parquet/Arrow part files, checkpointed whenever a part of part_size reports is closed
+
+    def __init__(self, path, state, resume, extension, part_size):
+        if not resume:
+            state['parts'] = 0
+        os.makedirs(path, exist_ok=True)
+        # drop part files that were not completed before the last checkpoint
+        for name in os.listdir(path):
+            stem, ext = os.path.splitext(name)
+            # other files (e.g. part-00003.tmp.parquet or editor backups) are left alone
+            part = re.fullmatch(r'part-(\d+)', stem)
+            if part and ext == extension and int(part.group(1)) >= state['parts']:
+                os.remove(os.path.join(path, name))
+        self.path = path
+        self.state = state
+        self.extension = extension
+        self.part_size = part_size
+        self.writer = None
+        self.part_reports = 0
+
+    def write(self, rows, num_reports):
+        if self.writer is None:
+            part_path = os.path.join(self.path, f"part-{self.state['parts']:05d}{self.extension}")
+            self.writer = LabelWriter(part_path)
+        self.writer.write_rows(rows)
+        self.part_reports += num_reports
+        if self.part_reports >= self.part_size:
+            self._close_part()
+            return True
+        return False
+
+    def _close_part(self):
+        self.writer.close()
+        self.writer = None
+        self.state['parts'] += 1
+        self.state['reports_done'] += self.part_reports
+        self.part_reports = 0
+
+    def finish(self):
+        if self.writer is None:
+            return False
+        self._close_part()
+        return True
+
+    def close(self):
+        # an unfinished part is left uncounted and removed on resume
+        if self.writer is not None:
+            self.writer.close()
+
+
+def run_pipeline(input_path, output_path, checkpoint_path=None, workers=None, chunk_size=64, restart=False,
+                 output_format='csv', part_size=10000, stats_path=None, profile_slowest=0, label_memo_path=None,
+                 label_memo_size=LABEL_MEMO_SIZE):
+    """
+    Run the sentence-level pipeline over a report-level corpus with a process pool.
+
+    With the CSV format, results are appended to the output CSV in input order as chunks complete
+    and the checkpoint is updated after every chunk. With the Parquet/Arrow formats, output_path is
+    a directory of part files of part_size reports each; every chunk is written as one row group
+    (record batch) as it completes, and the checkpoint is updated whenever a part file is closed.
+    An interrupted run resumes from the last checkpoint.
+
+    Args:
+        input_path: str, report-level CSV/JSONL file
+        output_path: str, sentence-level CSV file (or directory of part files) to write
+        checkpoint_path: str, checkpoint file (defaults to output_path + '.checkpoint.json')
+        workers: int, number of worker processes (defaults to the number of CPUs)
+        chunk_size: int, number of reports per task sent to a worker
+        restart: bool, ignore any existing checkpoint and start over; without it, a checkpoint written for
+            another input file or output format raises ValueError
+        output_format: str, 'csv', 'parquet' or 'arrow' (Parquet/Arrow require pyarrow)
+        part_size: int, number of reports per Parquet/Arrow part file
+        stats_path: str, write stage timers, branch counters and the report latency histogram of this
+            run to this JSON file (instrumentation is off when not given)
+        profile_slowest: int, with stats_path, profile the slowest N reports again under cProfile
+        label_memo_path: str, SQLite store of sentence pair labels shared by the workers and by later
+            runs (emptied automatically when the patterns in utils.py change)
+        label_memo_size: int, sentence pair labels memoized in memory per worker (0 to disable the
+            in-memory memo)
+
+    Returns:
+        Tuple (number of reports processed in total including those from earlier runs, dict of label memo
+        hits, store_hits and misses of this run or None when the memo is disabled)
+    """
+    checkpoint_path = checkpoint_path or output_path.rstrip(os.sep) + '.checkpoint.json'
+    workers = workers or os.cpu_count()
+    state = None if restart else load_checkpoint(checkpoint_path)
+    if state is not None:
+        # resuming against another input or format would skip the wrong rows or mix outputs
+        if os.path.abspath(state['input']) != os.path.abspath(input_path):
+            raise ValueError(f"Checkpoint '{checkpoint_path}' belongs to input '{state['input']}', not "
+                             f"'{input_path}' (rerun with --restart to start over)")
+        if state.get('format', 'csv') != output_format:
+            raise ValueError(f"Checkpoint '{checkpoint_path}' was written with format '{state.get('format', 'csv')}', "
+                             f"not '{output_format}' (rerun with --restart to start over)")
+
+    resume = state is not None and os.path.exists(output_path)
+    if not resume:
+        state = {'input': input_path, 'format': output_format, 'reports_done': 0}
+    if output_format == 'csv':
+        output = _CsvOutput(output_path, state, resume)
+    else:
+        output = _PartitionedOutput(output_path, state, resume, '.' + output_format, part_size)
+    if not resume:
+        save_checkpoint(checkpoint_path, state)
+
+    records = islice(read_report_pairs(input_path), state['reports_done'], None)
+    stats = instrumentation.Stats(profile_slowest) if stats_path else None
+    task = process_chunk_instrumented if stats else process_chunk
+    memo_counts = {'hits': 0, 'store_hits': 0, 'misses': 0} if label_memo_size or label_memo_path else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(profile_slowest if stats else None, label_memo_path,
+                                           label_memo_size)) as executor:
+            pending = deque()
+            chunks = _chunks(records, chunk_size)
+
+            def submit_next():
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.append((len(chunk), executor.submit(task, chunk)))
+
+            # keep a bounded number of chunks in flight so memory stays flat on large corpora
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                num_reports, future = pending.popleft()
+                rows, chunk_memo_counts, *chunk_stats = future.result()
+                if chunk_stats:
+                    stats.merge(instrumentation.Stats.from_dict(chunk_stats[0]))
+                if chunk_memo_counts:
+                    for key, count in chunk_memo_counts.items():
+                        memo_counts[key] += count
+                if output.write(rows, num_reports):
+                    save_checkpoint(checkpoint_path, state)
+                submit_next()
+
+        if output.finish():
+            save_checkpoint(checkpoint_path, state)
+    finally:
+        output.close()
+
+    if stats:
+        if profile_slowest:
+            warmup()
+            instrumentation.profile_slowest(stats, _profile_report, setup=clear_caches)
+        stats.dump(stats_path)
+
+    return state['reports_done'], memo_counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Splice and label ReXErr report pairs at the sentence level.')
+    parser.add_argument('input', help='report-level CSV or JSONL file (original_report, error_report)')
+    parser.add_argument('output', help='sentence-level CSV file (or directory of Parquet/Arrow part files) to write')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='reports per worker task')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint and start over')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv', help='output format')
+    parser.add_argument('--part-size', type=int, default=10000, help='reports per Parquet/Arrow part file')
+    parser.add_argument('--stats', default=None, help='write stage timers, branch counters and latencies to JSON')
+    parser.add_argument('--profile-slowest', type=int, default=0, help='with --stats, cProfile the slowest N reports')
+    parser.add_argument('--label-memo', default=None, help='SQLite store of sentence pair labels shared by workers')
+    parser.add_argument('--label-memo-size', type=int, default=LABEL_MEMO_SIZE,
+                        help='sentence pair labels memoized in memory per worker (0 to disable)')
+    args = parser.parse_args()
+
+    try:
+        num_reports, memo_counts = run_pipeline(args.input, args.output, args.checkpoint, args.workers,
+                                                args.chunk_size, args.restart, args.format, args.part_size,
+                                                args.stats, args.profile_slowest, args.label_memo,
+                                                args.label_memo_size)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Processed {num_reports} reports. Results saved to '{args.output}'")
+    if memo_counts:
+        hits = memo_counts['hits'] + memo_counts['store_hits']
+        lookups = hits + memo_counts['misses']
+        if lookups:
+            shared = f" ({memo_counts['store_hits']} from the shared store)" if args.label_memo else ''
+            print(f"Label memo hit rate: {hits / lookups:.1%} of {lookups} sentence pairs{shared}")
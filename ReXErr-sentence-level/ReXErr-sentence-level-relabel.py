@@ -0,0 +1,146 @@
+import argparse
+import csv
+import importlib
+import os
+import sys
+from functools import lru_cache
+from itertools import islice
+
+from columnar_output import FORMATS, LABEL_COLUMNS, LabelWriter, iter_label_batches
+from utils import PATTERN_VERSION, PatternHits, WORD_CACHE_SIZE
+
+# the labeling script has a hyphenated file name, so it is loaded through importlib
+labeling = importlib.import_module('ReXErr-sentence-level-label-regex')
+
+
+def read_labels(path, batch_size=65536):
+    """
+    Stream labeled sentence pairs written by the sentence-level pipeline.
+
+    Args:
+        path: str, CSV file, or Parquet/Arrow file or directory of part files
+        batch_size: int, rows per batch read from Parquet/Arrow files
+
+    Returns:
+        Iterator of dicts keyed by LABEL_COLUMNS
+    """
+    if os.path.isdir(path) or os.path.splitext(path)[1] in FORMATS:
+        for batch in iter_label_batches(path, batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, 'r', newline='') as file:
+            yield from csv.DictReader(file)
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _pattern_hits(sentence):
+    return PatternHits(sentence)
+
+
+def relabel_pair(orig_sentence, err_sentence, error_type):
+    """
+    Label a sentence pair again with the current patterns.
+
+    The "Add repetition" check needs the original report, but its outcome does not depend on the
+    patterns, so it is reproduced from the stored error type.
+
+    Args:
+        orig_sentence: str, original sentence
+        err_sentence: str, error sentence
+        error_type: str, previously assigned error type
+
+    Returns:
+        Tuple (label, error type)
+    """
+    original_report = err_sentence if error_type == "Add repetition" else ''
+    labels, error_types = labeling.label_errors([orig_sentence], [err_sentence], original_report, '')
+    return labels[0], error_types[0]
+
+
+def relabel(rows, stats):
+    """
+    Bring labeled sentence pairs up to date with the current patterns.
+
+    Pairs already labeled with the current PATTERN_VERSION are kept. For the other pairs, the
+    pattern families their label depended on are re-scanned (no tokenizing or tagging); pairs whose
+    hit digest is unchanged keep their label, and only the remaining pairs go through label_errors.
+
+    Args:
+        rows: iterable of dicts keyed by LABEL_COLUMNS
+        stats: dict of counters, updated in place: pairs, current, skipped, recomputed, changed
+
+    Returns:
+        Iterator of updated row dicts
+    """
+    for row in rows:
+        stats['pairs'] += 1
+        if row.get('pattern_version') == PATTERN_VERSION:
+            stats['current'] += 1
+            yield row
+            continue
+
+        orig_sentence = row['original_sentence'] or ''
+        err_sentence = row['error_sentence'] or ''
+        error_type = row['error_type']
+        if row.get('hit_digest'):
+            families = labeling.label_dependencies(orig_sentence, err_sentence, error_type)
+            digest = labeling.hit_digest(_pattern_hits(orig_sentence), _pattern_hits(err_sentence), families)
+            if digest == row['hit_digest']:
+                stats['skipped'] += 1
+                row['pattern_version'] = PATTERN_VERSION
+                yield row
+                continue
+
+        label, new_error_type = relabel_pair(orig_sentence, err_sentence, error_type)
+        stats['recomputed'] += 1
+        if label != int(row['error_present']) or new_error_type != error_type:
+            stats['changed'] += 1
+        row['error_present'] = label
+        row['error_type'] = new_error_type
+        row['pattern_version'] = PATTERN_VERSION
+        row['hit_digest'] = labeling.pair_hit_digest(orig_sentence, err_sentence, new_error_type)
+        yield row
+
+
+def run_relabel(input_path, output_path, batch_size=65536):
+    """
+    Re-label a sentence-level label file after the patterns in utils.py changed.
+
+    Args:
+        input_path: str, labels written by the pipeline (CSV, Parquet/Arrow file or directory)
+        output_path: str, .csv, .parquet or .arrow file to write
+        batch_size: int, rows per batch read and written
+
+    Returns:
+        Dict of counters: pairs, current, skipped, recomputed, changed
+    """
+    stats = {'pairs': 0, 'current': 0, 'skipped': 0, 'recomputed': 0, 'changed': 0}
+    rows = relabel(read_labels(input_path, batch_size), stats)
+    if os.path.splitext(output_path)[1] in FORMATS:
+        with LabelWriter(output_path) as writer:
+            while True:
+                batch = [[row.get(column) for column in LABEL_COLUMNS] for row in islice(rows, batch_size)]
+                if not batch:
+                    break
+                writer.write_rows(batch)
+    else:
+        with open(output_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=LABEL_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+    return stats
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Re-label sentence pairs affected by changed patterns in utils.py.')
+    parser.add_argument('input', help='labels written by the pipeline (CSV, Parquet/Arrow file or directory)')
+    parser.add_argument('output', help='.csv, .parquet or .arrow file to write')
+    parser.add_argument('--batch-size', type=int, default=65536, help='rows per batch')
+    args = parser.parse_args()
+
+    stats = run_relabel(args.input, args.output, args.batch_size)
+    print(f"{stats['pairs']} pairs: {stats['current']} already current, {stats['skipped']} skipped "
+          f"(pattern hits unchanged), {stats['recomputed']} recomputed ({stats['changed']} changed). "
+          f"Results saved to '{args.output}'")
@@ -1,5 +1,44 @@
 import re
-from utils import get_nouns, get_adj
+import numpy as np
+from instrumentation import timer
+from utils import sentence_features
+
+ABBREVIATIONS = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Sr.', 'Jr.', 'e.g.', 'i.e.', 'etc.', 'vs.', 'a.m.', 'p.m.']
+
+# A sentence ends at the whitespace character following '.', '!' or '?', unless the period follows
+# a digit or ends one of the abbreviations (checked with one lookbehind each, in a single pass)
+SENTENCE_BOUNDARY = re.compile(
+    r'[.!?](?<!\d\.)' + ''.join(f'(?<!{re.escape(abbr)})' for abbr in ABBREVIATIONS) + r'(\s)'
+)
+
+
+def sentence_spans(text):
+    """
+    Find the sentences of a block of text as offsets, without copying the text.
+
+    Args:
+        text: str, block of text to split into sentences
+
+    Returns:
+        List of (start, end) tuples, one per non-empty sentence, with surrounding whitespace excluded
+    """
+    spans = []
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        spans.append((start, boundary.start(1)))
+        start = boundary.end(1)
+    spans.append((start, len(text)))
+
+    stripped = []
+    for start, end in spans:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            stripped.append((start, end))
+    return stripped
+
 
 def split_sentences(text):
     """
@@ -13,17 +52,139 @@ def split_sentences(text):
     """
     if isinstance(text, list):
         text = ' '.join(text)
+    return [text[start:end] for start, end in sentence_spans(text)]
 
-    abbreviations = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Sr.', 'Jr.', 'e.g.', 'i.e.', 'etc.', 'vs.', 'a.m.', 'p.m.']
-    
-    # Replace periods in abbreviations with a special marker
-    for abbr in abbreviations:
-        text = text.replace(abbr, abbr.replace('.', '@'))
-    
-    pattern = r'(?<!\d\.)(?<=[.!?])\s'
-    sentences = re.split(pattern, text)
-    sentences = [s.replace('@', '.') for s in sentences]
-    return [s.strip() for s in sentences if s.strip()]
+
+def _token_counts(token_lists, vocab):
+    # Map tokens to integer ids, returning the (sentence row, token id) of every token
+    rows, cols = [], []
+    for row, tokens in enumerate(token_lists):
+        for token in tokens:
+            rows.append(row)
+            cols.append(vocab.setdefault(token, len(vocab)))
+    return rows, cols
+
+
+def overlap_matrices(features1, features2):
+    """
+    Compute noun and adjective overlap counts between every pair of sentences of two reports.
+
+    Entry [i, j] of each matrix equals sum(1 for token in tokens1[i] if token in tokens2[j]),
+    i.e. tokens of the first sentence are counted with multiplicity and tokens of the
+    second sentence by presence.
+
+    Args:
+        features1: list of SentenceFeatures, sentences of the first report
+        features2: list of SentenceFeatures, sentences of the second report
+
+    Returns:
+        Tuple of two int arrays of shape (len(features1), len(features2)): noun overlap, adjective overlap
+    """
+    matrices = []
+    for attribute in ('nouns', 'adjectives'):
+        vocab = {}
+        rows1, cols1 = _token_counts([getattr(features, attribute) for features in features1], vocab)
+        rows2, cols2 = _token_counts([getattr(features, attribute) for features in features2], vocab)
+        counts1 = np.zeros((len(features1), len(vocab)), dtype=np.int32)
+        np.add.at(counts1, (rows1, cols1), 1)
+        presence2 = np.zeros((len(features2), len(vocab)), dtype=np.int32)
+        presence2[rows2, cols2] = 1
+        matrices.append(counts1 @ presence2.T)
+    return tuple(matrices)
+
+
+def match_sentence_indices(sentences1, sentences2):
+    """
+    Match sentences between two reports based on noun and adjective overlap.
+
+    Args:
+        sentences1: list of str, sentences of the first report
+        sentences2: list of str, sentences of the second report
+
+    Returns:
+        Tuple of two int arrays: for each sentence of the first report, the index of its match in the
+        second report, and for each sentence of the second report, the index of its match in the first
+        report (-1 where a sentence is unmatched).
+    """
+    # Featurize each sentence once (POS tagging is cached per sentence text)
+    with timer('match_sentences.featurize'):
+        features1 = [sentence_features(sentence) for sentence in sentences1]
+        features2 = [sentence_features(sentence) for sentence in sentences2]
+
+    # Initialize tracking arrays
+    matches1_to_2 = np.full(len(sentences1), -1, dtype=np.intp)
+    matches2_to_1 = np.full(len(sentences2), -1, dtype=np.intp)
+
+    def match(i, j):
+        matches1_to_2[i] = j
+        matches2_to_1[j] = i
+
+    # First pass: Match findings/impressions sentences
+    with timer('match_sentences.pass1'):
+        for i in range(len(sentences1)):
+            nouns1 = features1[i].nouns
+            for j in range(len(sentences2)):
+                if matches2_to_1[j] >= 0:
+                    continue
+
+                nouns2 = features2[j].nouns
+                # Check for exact matches of 'impression' or 'findings'
+                if ('impression' in nouns1 and 'impression' in nouns2) or \
+                   ('findings' in nouns1 and 'findings' in nouns2):
+                    match(i, j)
+                    break
+
+    # Second pass: Match exact sentence matches
+    with timer('match_sentences.pass2'):
+        for i in range(len(sentences1)):
+            if matches1_to_2[i] >= 0:
+                continue
+
+            for j in range(len(sentences2)):
+                if matches2_to_1[j] >= 0:
+                    continue
+
+                if features1[i].lower == features2[j].lower:  # Case-insensitive comparison
+                    match(i, j)
+                    break
+
+    # Overlap counts for every sentence pair, computed once for the third and fourth passes
+    with timer('match_sentences.overlap'):
+        noun_overlap, adj_overlap = overlap_matrices(features1, features2)
+        available2 = matches2_to_1 < 0
+
+    # Third pass: Match based on adjective and noun overlap
+    with timer('match_sentences.pass3'):
+        for i in range(len(sentences1)):
+            if matches1_to_2[i] >= 0 or not available2.any():
+                continue
+
+            # Only consider matches with at least one overlapping noun AND one overlapping adjective
+            valid = available2 & (noun_overlap[i] > 0) & (adj_overlap[i] > 0)
+            total_overlap = np.where(valid, noun_overlap[i] + adj_overlap[i], 0)
+            best_match_index = int(np.argmax(total_overlap))  # first index with the largest overlap
+
+            # If we found a match with both noun and adjective overlap, use it
+            if total_overlap[best_match_index] > 0:
+                match(i, best_match_index)
+                available2[best_match_index] = False
+
+    # Fourth pass: Match based only on noun overlap for remaining unmatched sentences
+    with timer('match_sentences.pass4'):
+        for i in range(len(sentences1)):
+            if matches1_to_2[i] >= 0 or not available2.any():
+                continue
+
+            # Only consider matches with at least one overlapping noun
+            overlap = np.where(available2, noun_overlap[i], 0)
+            best_match_index = int(np.argmax(overlap))
+
+            # If we found a match with noun overlap, use it
+            if overlap[best_match_index] > 0:
+                match(i, best_match_index)
+                available2[best_match_index] = False
+
+    return matches1_to_2, matches2_to_1
 
 
 def match_sentences(paragraph1, paragraph2):
@@ -42,122 +203,88 @@ def match_sentences(paragraph1, paragraph2):
     # Split paragraphs into sentences
     sentences1 = split_sentences(paragraph1)
     sentences2 = split_sentences(paragraph2)
-    
-    # Initialize tracking arrays
-    matched_indices2 = [False] * len(sentences2)
-    matched_indices1 = [False] * len(sentences1)
-    matches1_to_2 = [None] * len(sentences1)
-    matches2_to_1 = [None] * len(sentences2)
-    
-    # First pass: Match findings/impressions sentences
-    for i, sentence1 in enumerate(sentences1):
-        if matched_indices1[i]:
-            continue
-            
-        nouns1 = get_nouns(sentence1)
-        for j, sentence2 in enumerate(sentences2):
-            if matched_indices2[j]:
-                continue
-                
-            nouns2 = get_nouns(sentence2)
-            # Check for exact matches of 'impression' or 'findings'
-            if ('impression' in nouns1 and 'impression' in nouns2) or \
-               ('findings' in nouns1 and 'findings' in nouns2):
-                matches1_to_2[i] = (sentence1, sentence2)
-                matches2_to_1[j] = (sentence1, sentence2)
-                matched_indices2[j] = True
-                matched_indices1[i] = True
-                break
-    
-    # Second pass: Match exact sentence matches
-    for i, sentence1 in enumerate(sentences1):
-        if matched_indices1[i]:
-            continue
-            
-        for j, sentence2 in enumerate(sentences2):
-            if matched_indices2[j]:
-                continue
-                
-            if sentence1.lower() == sentence2.lower():  # Case-insensitive comparison
-                matches1_to_2[i] = (sentence1, sentence2)
-                matches2_to_1[j] = (sentence1, sentence2)
-                matched_indices2[j] = True
-                matched_indices1[i] = True
-                break
-    
-    # Third pass: Match based on adjective and noun overlap
-    for i, sentence1 in enumerate(sentences1):
-        if matched_indices1[i]:
-            continue
-            
-        nouns1 = get_nouns(sentence1)
-        adj1 = get_adj(sentence1)
-        best_match_index = None
-        max_overlap = 0
-        
-        for j, sentence2 in enumerate(sentences2):
-            if matched_indices2[j]:
-                continue
-                
-            nouns2 = get_nouns(sentence2)
-            adj2 = get_adj(sentence2)
-            
-            # Calculate overlap for both nouns and adjectives
-            noun_overlap = sum(1 for noun in nouns1 if noun in nouns2)
-            adj_overlap = sum(1 for adj in adj1 if adj in adj2)
-            total_overlap = noun_overlap + adj_overlap
-            
-            # Only consider matches with at least one overlapping noun AND one overlapping adjective
-            if noun_overlap > 0 and adj_overlap > 0 and total_overlap > max_overlap:
-                max_overlap = total_overlap
-                best_match_index = j
-        
-        # If we found a match with both noun and adjective overlap, use it
-        if best_match_index is not None:
-            matches1_to_2[i] = (sentence1, sentences2[best_match_index])
-            matches2_to_1[best_match_index] = (sentence1, sentences2[best_match_index])
-            matched_indices2[best_match_index] = True
-            matched_indices1[i] = True
-    
-    # Fourth pass: Match based only on noun overlap for remaining unmatched sentences
-    for i, sentence1 in enumerate(sentences1):
-        if matched_indices1[i]:
-            continue
-            
-        nouns1 = get_nouns(sentence1)
-        best_match_index = None
-        max_overlap = 0
-        
-        for j, sentence2 in enumerate(sentences2):
-            if matched_indices2[j]:
-                continue
-                
-            nouns2 = get_nouns(sentence2)
-            noun_overlap = sum(1 for noun in nouns1 if noun in nouns2)
-            
-            # Only consider matches with at least one overlapping noun
-            if noun_overlap > max_overlap:
-                max_overlap = noun_overlap
-                best_match_index = j
-        
-        # If we found a match with noun overlap, use it
-        if best_match_index is not None and max_overlap > 0:
-            matches1_to_2[i] = (sentence1, sentences2[best_match_index])
-            matches2_to_1[best_match_index] = (sentence1, sentences2[best_match_index])
-            matched_indices2[best_match_index] = True
-            matched_indices1[i] = True
-    
-    # Final pass: Handle unmatched sentences
-    for i, matched in enumerate(matched_indices1):
-        if not matched:
-            matches1_to_2[i] = (sentences1[i], '')
-            
-    for j, matched in enumerate(matched_indices2):
-        if not matched:
-            matches2_to_1[j] = ('', sentences2[j])
-    
+
+    indices1to2, indices2to1 = match_sentence_indices(sentences1, sentences2)
+    matches1_to_2 = [(sentence1, sentences2[j] if j >= 0 else '') for sentence1, j in zip(sentences1, indices1to2)]
+    matches2_to_1 = [(sentences1[i] if i >= 0 else '', sentence2) for i, sentence2 in zip(indices2to1, sentences2)]
     return matches1_to_2, matches2_to_1
 
+
+def align_matches(matches1to2, matches2to1):
+    """
+    Order matched sentence indices into a single alignment of the two reports in O(n + m).
+
+    Sentences of the first report keep their order; unmatched sentences of the second report are
+    inserted before the next matched sentence that follows them in the second report. When a match
+    crosses an earlier one, the rest of the second report is emitted at that point (as combine_matches
+    always did).
+
+    Args:
+        matches1to2: int array from match_sentence_indices, match in the second report of each sentence of the first
+        matches2to1: int array from match_sentence_indices, match in the first report of each sentence of the second
+
+    Returns:
+        Int array of shape (num_pairs, 2) with (first report index, second report index) rows, -1 for a gap
+    """
+    alignment = []
+    cursor = 0
+    num_sentences2 = len(matches2to1)
+    for i, j in enumerate(matches1to2):
+        j = int(j)
+        if j < 0:
+            alignment.append((i, -1))
+            continue
+        # walk the second report up to the matched sentence; past it, the match was already emitted
+        stop = j if j >= cursor else num_sentences2
+        alignment.extend((int(matches2to1[k]), k) for k in range(cursor, stop))
+        if j >= cursor:
+            alignment.append((i, j))
+            stop += 1
+        cursor = stop
+
+    # Add remaining sentences of the second report
+    alignment.extend((int(matches2to1[k]), k) for k in range(cursor, num_sentences2))
+    return np.array(alignment, dtype=np.intp).reshape(-1, 2)
+
+
+def alignment_pairs(alignment, sentences1, sentences2):
+    """
+    Materialize an alignment as (sentence1, sentence2) string tuples.
+
+    Args:
+        alignment: int array of shape (num_pairs, 2) from align_matches
+        sentences1: list of str, sentences of the first report
+        sentences2: list of str, sentences of the second report
+
+    Returns:
+        List of tuples (sentence1, sentence2), with '' for a gap
+    """
+    return [
+        (sentences1[i] if i >= 0 else '', sentences2[j] if j >= 0 else '')
+        for i, j in alignment.tolist()
+    ]
+
+
+def align_reports(paragraph1, paragraph2):
+    """
+    Split, match and align two reports, keeping the result as sentence indices.
+
+    Args:
+        paragraph1: str, original report
+        paragraph2: str, error report
+
+    Returns:
+        Tuple (sentences1, sentences2, alignment) with alignment as returned by align_matches
+    """
+    with timer('split_sentences'):
+        sentences1 = split_sentences(paragraph1)
+        sentences2 = split_sentences(paragraph2)
+    matches1to2, matches2to1 = match_sentence_indices(sentences1, sentences2)
+    with timer('align_matches'):
+        alignment = align_matches(matches1to2, matches2to1)
+    return sentences1, sentences2, alignment
+
+
 def combine_matches(matches1to2, matches2to1):
     """
     Combines matches1to2 and matches2to1 into a single ordered list of matched pairs.
@@ -171,27 +298,27 @@ def combine_matches(matches1to2, matches2to1):
     Returns:
         List of tuples (sentence1, sentence2) in correct combined order
     """
-    combined_matches = []
-    i = 0
-    for match in matches1to2:
-        sentence1, sentence2 = match
-        if sentence2 == '':
-            combined_matches.append(match)
-        else:
-            while i < len(matches2to1) and matches2to1[i][1] != sentence2:
-                combined_matches.append(matches2to1[i])
-                i += 1
-            if match not in combined_matches:
-                combined_matches.append(match)
-                i += 1
-
-    # Add remaining unmatched sentences from matches2to1
-    for match in matches2to1[i:]:
-        # if it has not been added to combined_matches, add it
-        if match not in combined_matches:
-            combined_matches.append(match)
-            
-    return combined_matches
+    # Recover indices: the k-th occurrence of a matched pair in matches1to2 is paired with
+    # its k-th occurrence in matches2to1, so repeated sentences keep their report order
+    positions2 = {}
+    for j, match in enumerate(matches2to1):
+        if match[0] != '':
+            positions2.setdefault(match, []).append(j)
+    indices1to2 = np.full(len(matches1to2), -1, dtype=np.intp)
+    indices2to1 = np.full(len(matches2to1), -1, dtype=np.intp)
+    seen = {}
+    for i, match in enumerate(matches1to2):
+        if match[1] == '':
+            continue
+        occurrence = seen.get(match, 0)
+        seen[match] = occurrence + 1
+        j = positions2[match][occurrence]
+        indices1to2[i] = j
+        indices2to1[j] = i
+
+    sentences1 = [match[0] for match in matches1to2]
+    sentences2 = [match[1] for match in matches2to1]
+    return alignment_pairs(align_matches(indices1to2, indices2to1), sentences1, sentences2)
 
 
 if __name__ == '__main__':
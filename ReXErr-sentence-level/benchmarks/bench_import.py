@@ -0,0 +1,59 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SENTENCE_LEVEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each snippet runs in a fresh interpreter and prints its own elapsed time
+SNIPPETS = {
+    'import utils': "import utils",
+    'import utils + warmup()': "import utils; utils.warmup()",
+    'eager heavy imports': "import pandas, phonetics, nltk; from nltk.corpus import wordnet; import utils",
+}
+
+
+def time_snippet(snippet, repeat):
+    """
+    Time a snippet in fresh interpreters.
+
+    Args:
+        snippet: str, Python code to run
+        repeat: int, number of interpreter launches
+
+    Returns:
+        List of elapsed times in seconds, one per launch
+
+    Raises:
+        RuntimeError: if the snippet fails, e.g. because NLTK data is not installed
+    """
+    code = (
+        "import time; _start = time.perf_counter()\n"
+        f"{snippet}\n"
+        "print(time.perf_counter() - _start)"
+    )
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', code], cwd=SENTENCE_LEVEL_DIR,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            raise RuntimeError(next((line for line in reversed(lines) if 'Error' in line), lines[-1]))
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return times
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure the cold-start cost of importing utils.')
+    parser.add_argument('--repeat', type=int, default=5, help='interpreter launches per snippet')
+    args = parser.parse_args()
+
+    for name, snippet in SNIPPETS.items():
+        try:
+            times = time_snippet(snippet, args.repeat)
+        except RuntimeError as error:
+            print(f"{name:26s} failed: {error}")
+            continue
+        print(f"{name:26s} median {statistics.median(times) * 1000:8.1f} ms   min {min(times) * 1000:8.1f} ms")
@@ -0,0 +1,56 @@
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import (devices_pattern, false_negation, location_pattern, severity_pattern, prior_pattern,
+                   measurement_pattern, lexicon_scanner)
+
+# MIMIC-CXR style sentences (median sentence length in the corpus is ~60-90 characters)
+SAMPLE_SENTENCES = [
+    "Impression: Compared to chest radiographs since ___, most recently ___.",
+    "Large right and moderate left pleural effusions and severe bibasilar atelectasis are unchanged.",
+    "Cardiac silhouette is obscured.",
+    "No pneumothorax.",
+    "Pulmonary edema is mild, obscured radiographically by overlying abnormalities.",
+    "Right IJ central venous catheter ends in the mid SVC, unchanged in position.",
+    "The endotracheal tube terminates 4 cm above the carina and the nasogastric tube courses below the diaphragm.",
+    "Left-sided dual-chamber pacemaker device is noted with leads terminating in the right atrium and right ventricle.",
+    "There is no focal consolidation, pleural effusion or pneumothorax.",
+    "Heart size is normal and the mediastinal and hilar contours are unremarkable.",
+    "Mild pulmonary vascular congestion has improved since the prior study.",
+    "A 5 mm nodule in the left upper lobe is again seen and is not significantly changed.",
+]
+
+
+def baseline_scan(sentence):
+    # the per-family calls label_errors made before the scanner existed
+    return {
+        'devices': re.findall(devices_pattern, sentence, re.IGNORECASE),
+        'false_negation': re.findall(false_negation, sentence),
+        'location': re.findall(location_pattern, sentence, re.IGNORECASE),
+        'severity': re.findall(severity_pattern, sentence, re.IGNORECASE),
+        'prior': re.findall(prior_pattern, sentence, re.IGNORECASE),
+        'measurement': re.findall(measurement_pattern, sentence, re.IGNORECASE),
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare the lexicon scanner against per-pattern re calls.')
+    parser.add_argument('--repeat', type=int, default=2000, help='passes over the sample sentences')
+    args = parser.parse_args()
+
+    # results must be identical before timing means anything
+    for sentence in SAMPLE_SENTENCES:
+        assert lexicon_scanner.scan(sentence) == baseline_scan(sentence), sentence
+
+    num_scans = args.repeat * len(SAMPLE_SENTENCES)
+    baseline_time = timeit.timeit(lambda: [baseline_scan(s) for s in SAMPLE_SENTENCES], number=args.repeat)
+    scanner_time = timeit.timeit(lambda: [lexicon_scanner.scan(s) for s in SAMPLE_SENTENCES], number=args.repeat)
+
+    print(f"baseline re calls: {baseline_time / num_scans * 1e6:.1f} us/sentence")
+    print(f"lexicon scanner:   {scanner_time / num_scans * 1e6:.1f} us/sentence")
+    print(f"speedup:           {baseline_time / scanner_time:.1f}x")
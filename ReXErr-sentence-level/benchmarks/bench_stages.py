@@ -0,0 +1,190 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+from synthetic_reports import generate_report_pairs
+
+splicing = importlib.import_module('ReXErr-sentence-level-splicing')
+labeling = importlib.import_module('ReXErr-sentence-level-label-regex')
+
+STAGES = ['split_sentences', 'match_sentences', 'combine_matches', 'label_errors', 'find_homophones_and_typos']
+
+
+def prepare_inputs(pairs):
+    """
+    Run every stage once so each stage can be timed on the outputs of the previous one
+
+    Args:
+        pairs: list of dicts from generate_report_pairs
+
+    Returns:
+        Dict mapping stage name to the list of argument tuples of its calls
+    """
+    inputs = {stage: [] for stage in STAGES}
+    for pair in pairs:
+        original_report, error_report = pair['original_report'], pair['error_report']
+        inputs['split_sentences'].extend([(original_report,), (error_report,)])
+        inputs['match_sentences'].append((original_report, error_report))
+        matches1to2, matches2to1 = splicing.match_sentences(original_report, error_report)
+        inputs['combine_matches'].append((matches1to2, matches2to1))
+        combined_matches = splicing.combine_matches(matches1to2, matches2to1)
+        original_sentences = [match[0] for match in combined_matches]
+        error_sentences = [match[1] for match in combined_matches]
+        inputs['label_errors'].append((original_sentences, error_sentences, original_report, error_report))
+        inputs['find_homophones_and_typos'].extend(
+            (original_sentence, error_sentence) for original_sentence, error_sentence in combined_matches
+            if original_sentence and error_sentence and original_sentence != error_sentence
+        )
+    return inputs
+
+
+def stage_function(stage):
+    if stage == 'split_sentences':
+        return splicing.split_sentences
+    if stage == 'match_sentences':
+        return splicing.match_sentences
+    if stage == 'combine_matches':
+        return splicing.combine_matches
+    if stage == 'label_errors':
+        return labeling.label_errors
+    return utils.find_homophones_and_typos
+
+
+def time_stage(function, calls, repeat):
+    """
+    Best-of-repeat wall time of one stage over all of its calls, starting from cold caches
+
+    Returns:
+        float, seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        # every stage is measured cold, as it would run on the first pass over an unseen corpus
+        utils.clear_caches()
+        start = time.perf_counter()
+        for args in calls:
+            function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def profile_stage(function, calls):
+    """
+    Allocation profile of one stage over all of its calls, starting from cold caches
+
+    Returns:
+        Dict with peak_bytes (traced peak), allocated_bytes and allocations (new blocks still live at the end)
+    """
+    utils.clear_caches()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for args in calls:
+        function(*args)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    return {
+        'peak_bytes': peak,
+        'allocated_bytes': sum(stat.size_diff for stat in diff if stat.size_diff > 0),
+        'allocations': sum(stat.count_diff for stat in diff if stat.count_diff > 0),
+    }
+
+
+def run_benchmark(num_reports, min_sentences, max_sentences, seed, repeat, stages, allocations):
+    """
+    Benchmark the sentence-level stages on a synthetic corpus
+
+    Returns:
+        Dict with the corpus configuration and per-stage results
+    """
+    pairs = generate_report_pairs(num_reports, min_sentences, max_sentences, seed=seed)
+    inputs = prepare_inputs(pairs)
+    results = {}
+    for stage in stages:
+        function, calls = stage_function(stage), inputs[stage]
+        seconds = time_stage(function, calls, repeat)
+        results[stage] = {
+            'calls': len(calls),
+            'seconds': seconds,
+            'reports_per_second': num_reports / seconds if seconds else float('inf'),
+            'calls_per_second': len(calls) / seconds if seconds else float('inf'),
+        }
+        if allocations:
+            results[stage].update(profile_stage(function, calls))
+    return {
+        'config': {'num_reports': num_reports, 'min_sentences': min_sentences, 'max_sentences': max_sentences,
+                   'seed': seed, 'repeat': repeat},
+        'stages': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare per-stage throughput against a stored baseline
+
+    Args:
+        results: dict from run_benchmark
+        baseline: dict from run_benchmark (loaded from JSON)
+        tolerance: float, allowed relative slowdown before a stage counts as a regression
+
+    Returns:
+        List of (stage, baseline seconds, current seconds, ratio, regressed) tuples
+    """
+    if results['config'] != baseline['config']:
+        print(f"Warning: corpus configuration differs from the baseline ({baseline['config']})")
+    rows = []
+    for stage, result in results['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        before = baseline['stages'][stage]['seconds']
+        ratio = result['seconds'] / before if before else float('inf')
+        rows.append((stage, before, result['seconds'], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the sentence-level splicing and labeling stages.')
+    parser.add_argument('--reports', type=int, default=500, help='number of synthetic report pairs')
+    parser.add_argument('--min-sentences', type=int, default=3, help='minimum sentences per report')
+    parser.add_argument('--max-sentences', type=int, default=12, help='maximum sentences per report')
+    parser.add_argument('--seed', type=int, default=0, help='corpus seed')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best is kept)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to benchmark')
+    parser.add_argument('--no-allocations', action='store_true', help='skip the tracemalloc profiles')
+    parser.add_argument('--save', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown vs the baseline')
+    args = parser.parse_args()
+
+    utils.warmup()
+    results = run_benchmark(args.reports, args.min_sentences, args.max_sentences, args.seed, args.repeat,
+                            args.stages, not args.no_allocations)
+
+    print(f"{'stage':<28}{'calls':>8}{'seconds':>10}{'reports/s':>12}{'peak KiB':>11}{'allocs':>10}")
+    for stage, result in results['stages'].items():
+        peak = f"{result['peak_bytes'] / 1024:.0f}" if 'peak_bytes' in result else '-'
+        allocs = str(result.get('allocations', '-'))
+        print(f"{stage:<28}{result['calls']:>8}{result['seconds']:>10.3f}{result['reports_per_second']:>12.1f}"
+              f"{peak:>11}{allocs:>10}")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        rows = compare(results, baseline, args.tolerance)
+        print(f"\n{'stage':<28}{'baseline s':>11}{'current s':>11}{'ratio':>8}")
+        for stage, before, after, ratio, regressed in rows:
+            print(f"{stage:<28}{before:>11.3f}{after:>11.3f}{ratio:>8.2f}{'  REGRESSION' if regressed else ''}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
@@ -0,0 +1,213 @@
+import random
+
+# Same categories as errors_word_dict in ReXErr-report-level/utils.py
+ERROR_CATEGORIES = {
+    0: "Add medical device",
+    1: "Change name of device",
+    2: "Change position of device",
+    3: "Change severity",
+    4: "Change location",
+    5: "False prediction",
+    6: "Change measurement",
+    7: "Add repetitions",
+    8: "Change to homophone",
+    9: "Add typo",
+    10: "Add contradiction",
+    11: "False negation"
+}
+
+LOCATIONS = ['right', 'left', 'bilateral', 'upper', 'lower', 'middle', 'lateral', 'medial']
+SEVERITIES = ['mild', 'moderate', 'severe', 'small', 'large', 'minimal', 'extensive']
+FINDINGS = ['pleural effusion', 'pneumothorax', 'atelectasis', 'consolidation', 'pulmonary edema', 'opacity',
+            'vascular congestion', 'nodule']
+DEVICES = ['endotracheal tube', 'nasogastric tube', 'PICC line', 'central venous catheter', 'pacemaker',
+           'chest tube', 'Dobbhoff tube', 'ICD']
+DEVICE_POSITIONS = ['terminates in the mid SVC', 'ends in the stomach', 'projects over the right atrium',
+                    'terminates 4 cm above the carina', 'is coiled in the esophagus', 'ends at the cavoatrial junction']
+HOMOPHONES = {'no': 'know', 'right': 'write', 'seen': 'scene', 'new': 'knew', 'four': 'for', 'there': 'their'}
+
+NORMAL_SENTENCES = [
+    "Heart size is normal.",
+    "The mediastinal and hilar contours are unremarkable.",
+    "There is no focal consolidation, pleural effusion or pneumothorax.",
+    "No acute cardiopulmonary process.",
+    "Lungs are clear.",
+    "No pneumothorax is seen.",
+    "Osseous structures are intact.",
+]
+PRIOR_SENTENCES = [
+    "Compared to chest radiographs since ___, most recently ___.",
+    "As compared to the previous radiograph, there is no relevant change.",
+    "Findings are unchanged since the prior study.",
+    "Dr. ___ discussed the findings with Dr. ___ at 8:55 a.m. on ___.",
+]
+
+
+def _finding_sentence(rng):
+    template = rng.choice([
+        "{Severity} {location} {finding}.",
+        "There is a {severity} {location} {finding}.",
+        "{Severity} {finding} in the {location} lower lobe is again seen.",
+        "A {size} mm {location} {finding} is noted.",
+        "{Location} {finding} measuring {size_cm} cm.",
+    ])
+    severity, location = rng.choice(SEVERITIES), rng.choice(LOCATIONS)
+    return template.format(severity=severity, Severity=severity.capitalize(), location=location,
+                           Location=location.capitalize(), finding=rng.choice(FINDINGS),
+                           size=rng.randint(3, 30), size_cm=rng.randint(1, 9))
+
+
+def _device_sentence(rng):
+    return f"{rng.choice(LOCATIONS).capitalize()} {rng.choice(DEVICES)} {rng.choice(DEVICE_POSITIONS)}."
+
+
+def generate_report(rng, num_sentences):
+    """
+    Generate a CXR-style report with findings, devices, normal and prior-referencing sentences
+
+    Args:
+        rng: random.Random, source of randomness
+        num_sentences: int, number of sentences
+
+    Returns:
+        List of str, the sentences of the report
+    """
+    sentences = []
+    for _ in range(num_sentences):
+        kind = rng.random()
+        if kind < 0.35:
+            sentences.append(_finding_sentence(rng))
+        elif kind < 0.55:
+            sentences.append(_device_sentence(rng))
+        elif kind < 0.85:
+            sentences.append(rng.choice(NORMAL_SENTENCES))
+        else:
+            sentences.append(rng.choice(PRIOR_SENTENCES))
+    if sentences:
+        sentences[0] = rng.choice(["FINDINGS: ", "IMPRESSION: "]) + sentences[0]
+    return sentences
+
+
+def _replace_word(sentence, choices, rng):
+    words = sentence.split(' ')
+    candidates = [i for i, word in enumerate(words) if word.lower().strip('.,') in choices]
+    if not candidates:
+        return None
+    i = rng.choice(candidates)
+    word = words[i].lower().strip('.,')
+    replacement = choices[word] if isinstance(choices, dict) else rng.choice([c for c in choices if c != word])
+    if words[i][0].isupper():
+        replacement = replacement.capitalize()
+    words[i] = replacement + words[i][len(word):]
+    return ' '.join(words)
+
+
+def inject_error(sentences, category, rng):
+    """
+    Inject one error of the given category into a report, in place
+
+    Args:
+        sentences: list of str, sentences of the report
+        category: int, key of ERROR_CATEGORIES
+        rng: random.Random, source of randomness
+
+    Returns:
+        bool, whether an error could be injected
+    """
+    indices = list(range(len(sentences)))
+    rng.shuffle(indices)
+    position = rng.randint(0, len(sentences))
+
+    if category == 0:
+        sentences.insert(position, _device_sentence(rng))
+        return True
+    if category == 5:
+        sentences.insert(position, _finding_sentence(rng))
+        return True
+    if category == 7:
+        if not sentences:
+            return False
+        sentences.insert(position, sentences[rng.choice(indices)])
+        return True
+    if category == 10:
+        finding = rng.choice(FINDINGS)
+        sentences.insert(position, f"No {finding}.")
+        sentences.insert(rng.randint(0, len(sentences)), f"There is a {rng.choice(SEVERITIES)} {finding}.")
+        return True
+
+    for i in indices:
+        sentence = sentences[i]
+        changed = None
+        if category == 1:
+            changed = next((sentence.replace(device, rng.choice([d for d in DEVICES if d != device]))
+                            for device in DEVICES if device in sentence), None)
+        elif category == 2:
+            changed = next((sentence.replace(pos, rng.choice([p for p in DEVICE_POSITIONS if p != pos]))
+                            for pos in DEVICE_POSITIONS if pos in sentence), None)
+        elif category == 3:
+            changed = _replace_word(sentence, SEVERITIES, rng)
+        elif category == 4:
+            changed = _replace_word(sentence, LOCATIONS, rng)
+        elif category == 6:
+            if ' mm ' in sentence or ' cm' in sentence:
+                changed = sentence.replace(' mm ', ' cm ') if ' mm ' in sentence else sentence.replace(' cm', ' mm')
+        elif category == 8:
+            changed = _replace_word(sentence, HOMOPHONES, rng)
+        elif category == 9:
+            words = sentence.split(' ')
+            long_words = [j for j, word in enumerate(words) if len(word) > 4 and word.isalpha()]
+            if long_words:
+                j = rng.choice(long_words)
+                k = rng.randint(1, len(words[j]) - 2)
+                words[j] = words[j][:k] + words[j][k + 1] + words[j][k] + words[j][k + 2:]
+                changed = ' '.join(words)
+        elif category == 11:
+            if not sentence.startswith(('No ', 'There is no')) and any(f in sentence for f in FINDINGS):
+                changed = "No " + next(f for f in FINDINGS if f in sentence) + "."
+        if changed is not None and changed != sentence:
+            sentences[i] = changed
+            return True
+    return False
+
+
+def generate_report_pairs(num_reports, min_sentences=3, max_sentences=12, errors_per_report=3,
+                          categories=None, seed=0):
+    """
+    Deterministically generate (original report, error report) pairs with injected errors
+
+    Args:
+        num_reports: int, number of report pairs
+        min_sentences: int, minimum number of sentences per original report
+        max_sentences: int, maximum number of sentences per original report
+        errors_per_report: int, number of distinct error categories sampled per report
+        categories: list of int, error categories to sample from (default: all of ERROR_CATEGORIES)
+        seed: int, random seed
+
+    Returns:
+        List of dicts with original_report, error_report and errors_sampled (category names)
+    """
+    rng = random.Random(seed)
+    categories = list(ERROR_CATEGORIES) if categories is None else list(categories)
+    pairs = []
+    for study_id in range(num_reports):
+        original = generate_report(rng, rng.randint(min_sentences, max_sentences))
+        error = list(original)
+        sampled = rng.sample(categories, min(errors_per_report, len(categories)))
+        injected = [ERROR_CATEGORIES[category] for category in sampled if inject_error(error, category, rng)]
+        separator = rng.choice(['  ', ' ', '\n '])
+        pairs.append({
+            'study_id': study_id,
+            'original_report': separator.join(original),
+            'error_report': separator.join(error),
+            'errors_sampled': injected,
+        })
+    return pairs
+
+
+if __name__ == '__main__':
+
+    for pair in generate_report_pairs(3, seed=1):
+        print(pair['errors_sampled'])
+        print(pair['original_report'])
+        print(pair['error_report'])
+        print()
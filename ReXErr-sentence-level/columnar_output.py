@@ -0,0 +1,179 @@
+import os
+
+from utils import lazy_import
+
+# pyarrow is optional and only needed for the Parquet/Arrow outputs
+
+ID_COLUMNS = ['dicom_id', 'study_id', 'subject_id']
+LABEL_COLUMNS = ID_COLUMNS + [
+    'original_sentence', 'error_sentence', 'error_present', 'error_type', 'pattern_version', 'hit_digest'
+]
+
+# Every error type label_errors can assign; error_type is stored as int8 indices into this list
+ERROR_TYPES = [
+    "Not applicable",
+    "Add repetition",
+    "Add medical device",
+    "False prediction",
+    "False negation",
+    "Change to homophone",
+    "Add typo",
+    "Change name of device",
+    "Change position of device",
+    "Change location",
+    "Change severity",
+    "Change measurement",
+]
+_ERROR_TYPE_CODES = {error_type: code for code, error_type in enumerate(ERROR_TYPES)}
+
+FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow'}
+
+
+def _pyarrow():
+    try:
+        return lazy_import('pyarrow')
+    except ImportError as error:
+        raise ImportError("Parquet/Arrow output requires pyarrow (pip install pyarrow)") from error
+
+
+def label_schema():
+    """
+    Arrow schema of the sentence-level label table.
+
+    Returns:
+        pyarrow.Schema with the id columns, the sentence pair, int8 error_present, dictionary-encoded
+        error_type and the pattern_version/hit_digest fingerprints used for re-labeling
+    """
+    pa = _pyarrow()
+    return pa.schema(
+        [pa.field(column, pa.string()) for column in ID_COLUMNS] + [
+            pa.field('original_sentence', pa.string()),
+            pa.field('error_sentence', pa.string()),
+            pa.field('error_present', pa.int8()),
+            pa.field('error_type', pa.dictionary(pa.int8(), pa.string())),
+            pa.field('pattern_version', pa.string()),
+            pa.field('hit_digest', pa.string()),
+        ]
+    )
+
+
+def rows_to_batch(rows):
+    """
+    Convert pipeline output rows into an Arrow record batch.
+
+    Args:
+        rows: list of lists ordered as LABEL_COLUMNS
+
+    Returns:
+        pyarrow.RecordBatch with the label_schema
+    """
+    pa = _pyarrow()
+    columns = dict(zip(LABEL_COLUMNS, zip(*rows))) if rows else {column: () for column in LABEL_COLUMNS}
+    try:
+        codes = [_ERROR_TYPE_CODES[error_type] for error_type in columns['error_type']]
+    except KeyError as error:
+        raise ValueError(f"Unknown error type {error.args[0]!r}") from None
+
+    arrays = [
+        pa.array(['' if value is None else str(value) for value in columns[column]], pa.string())
+        for column in ID_COLUMNS
+    ]
+    arrays += [
+        pa.array(columns['original_sentence'], pa.string()),
+        pa.array(columns['error_sentence'], pa.string()),
+        pa.array([int(label) for label in columns['error_present']], pa.int8()),
+        pa.DictionaryArray.from_arrays(pa.array(codes, pa.int8()), pa.array(ERROR_TYPES, pa.string())),
+        pa.array(columns['pattern_version'], pa.string()),
+        pa.array(columns['hit_digest'], pa.string()),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=label_schema())
+
+
+class LabelWriter:
+    """
+    Streaming writer of sentence-level labels to a Parquet (.parquet) or Arrow IPC (.arrow) file.
+
+    Every call to write_rows emits one row group (Parquet) or record batch (Arrow), so rows can be
+    written as pipeline chunks finish without holding the table in memory.
+    """
+
+    def __init__(self, path, compression='zstd'):
+        """
+        Args:
+            path: str, output file, the format is chosen by its extension
+            compression: str, Parquet column compression
+        """
+        extension = os.path.splitext(path)[1]
+        if extension not in FORMATS:
+            raise ValueError(f"Unsupported output extension {extension!r}, expected one of {sorted(FORMATS)}")
+        self.path = path
+        self.format = FORMATS[extension]
+        self.rows_written = 0
+        if self.format == 'parquet':
+            parquet = lazy_import('pyarrow.parquet')
+            self._writer = parquet.ParquetWriter(path, label_schema(), compression=compression)
+        else:
+            pa = _pyarrow()
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, label_schema())
+
+    def write_rows(self, rows):
+        """
+        Append rows as one row group / record batch.
+
+        Args:
+            rows: list of pipeline output rows (see rows_to_batch)
+        """
+        if not rows:
+            return
+        batch = rows_to_batch(rows)
+        self._writer.write_batch(batch)
+        self.rows_written += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        if self.format == 'arrow':
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _label_files(path):
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path) if os.path.splitext(name)[1] in FORMATS
+        )
+    return [path]
+
+
+def iter_label_batches(path, batch_size=65536, columns=None):
+    """
+    Stream sentence-level labels from a Parquet/Arrow file or a directory of part files.
+
+    Files are memory-mapped and read one row group / record batch at a time, so only the current
+    batch is decoded into memory. Arrow IPC batches are zero-copy views of the mapped file.
+
+    Args:
+        path: str, .parquet or .arrow file, or a directory of them (read in file name order)
+        batch_size: int, maximum rows per batch for Parquet files
+        columns: list of str, columns to read (default: all)
+
+    Returns:
+        Iterator of pyarrow.RecordBatch
+    """
+    pa = _pyarrow()
+    for file_path in _label_files(path):
+        if FORMATS.get(os.path.splitext(file_path)[1]) == 'arrow':
+            with pa.memory_map(file_path, 'r') as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    yield batch.select(columns) if columns is not None else batch
+        else:
+            parquet = lazy_import('pyarrow.parquet')
+            parquet_file = parquet.ParquetFile(file_path, memory_map=True)
+            yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
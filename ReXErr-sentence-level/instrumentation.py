@@ -0,0 +1,263 @@
+import cProfile
+import heapq
+import io
+import json
+import pstats
+from contextlib import nullcontext
+from time import perf_counter
+
+# Opt-in instrumentation of the sentence-level stages. While disabled (the default), timer()
+# returns a shared no-op context manager and count() returns immediately.
+
+# Upper bounds (seconds) of the per-report latency histogram buckets; the last bucket is open-ended
+LATENCY_BOUNDS = [0.000125 * 2 ** k for k in range(18)]
+
+
+class Stats:
+    """
+    Stage timers, branch counters, a per-report latency histogram and the slowest reports.
+
+    Stats from several worker processes are combined with merge() after a round trip through
+    to_dict()/from_dict().
+    """
+
+    def __init__(self, slowest=0):
+        """
+        Args:
+            slowest: int, number of slowest reports to keep (with their inputs) for profiling
+        """
+        self.timers = {}
+        self.counters = {}
+        self.latency_counts = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.latency_total = 0.0
+        self.reports = 0
+        self.slowest_limit = slowest
+        self.slowest = []  # min-heap of (seconds, report_id, original_report, error_report)
+        self.profiles = []
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_report(self, seconds, report_id='', original_report='', error_report=''):
+        """
+        Record the end-to-end latency of one report
+
+        Args:
+            seconds: float, time spent on the report
+            report_id: str, identifier of the report
+            original_report: str, kept with error_report for the slowest reports so they can be profiled
+            error_report: str
+        """
+        self.reports += 1
+        self.latency_total += seconds
+        bucket = 0
+        while bucket < len(LATENCY_BOUNDS) and seconds > LATENCY_BOUNDS[bucket]:
+            bucket += 1
+        self.latency_counts[bucket] += 1
+        if self.slowest_limit:
+            entry = (seconds, report_id, original_report, error_report)
+            if len(self.slowest) < self.slowest_limit:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def latency_percentile(self, fraction):
+        """
+        Approximate latency percentile from the histogram
+
+        Args:
+            fraction: float in [0, 1], e.g. 0.99
+
+        Returns:
+            Upper bound (seconds) of the bucket containing the percentile, or None without reports
+        """
+        if not self.reports:
+            return None
+        rank = fraction * self.reports
+        seen = 0
+        for bucket, count in enumerate(self.latency_counts):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BOUNDS[bucket] if bucket < len(LATENCY_BOUNDS) else float('inf')
+        return float('inf')
+
+    def merge(self, other):
+        """
+        Add the stats of another Stats object (e.g. from a worker process) into this one
+
+        Args:
+            other: Stats
+        """
+        for name, (calls, seconds) in other.timers.items():
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        self.latency_counts = [a + b for a, b in zip(self.latency_counts, other.latency_counts)]
+        self.latency_total += other.latency_total
+        self.reports += other.reports
+        self.slowest_limit = max(self.slowest_limit, other.slowest_limit)
+        self.slowest = heapq.nlargest(self.slowest_limit, self.slowest + other.slowest)
+        heapq.heapify(self.slowest)
+        self.profiles.extend(other.profiles)
+
+    def to_dict(self):
+        return {
+            'timers': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.timers.items()},
+            'counters': dict(self.counters),
+            'latency': {
+                'reports': self.reports,
+                'total_seconds': self.latency_total,
+                'bounds': LATENCY_BOUNDS,
+                'counts': self.latency_counts,
+                'p50': self.latency_percentile(0.5),
+                'p90': self.latency_percentile(0.9),
+                'p99': self.latency_percentile(0.99),
+            },
+            'slowest_limit': self.slowest_limit,
+            'slowest': [
+                {'seconds': seconds, 'report_id': report_id, 'original_report': original, 'error_report': error}
+                for seconds, report_id, original, error in sorted(self.slowest, reverse=True)
+            ],
+            'profiles': self.profiles,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data.get('slowest_limit', 0))
+        stats.timers = {name: [timer['calls'], timer['seconds']] for name, timer in data['timers'].items()}
+        stats.counters = dict(data['counters'])
+        stats.latency_counts = list(data['latency']['counts'])
+        stats.latency_total = data['latency']['total_seconds']
+        stats.reports = data['latency']['reports']
+        stats.slowest = [
+            (report['seconds'], report['report_id'], report['original_report'], report['error_report'])
+            for report in data['slowest']
+        ]
+        heapq.heapify(stats.slowest)
+        stats.profiles = list(data.get('profiles', []))
+        return stats
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class _Timer:
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, perf_counter() - self.start)
+
+
+_NULL_TIMER = nullcontext()
+_stats = None
+
+
+def enable(slowest=0):
+    """
+    Start collecting stats in this process
+
+    Args:
+        slowest: int, number of slowest reports to keep for profiling
+
+    Returns:
+        The new Stats object
+    """
+    global _stats
+    _stats = Stats(slowest)
+    return _stats
+
+
+def disable():
+    global _stats
+    _stats = None
+
+
+def enabled():
+    return _stats is not None
+
+
+def collect():
+    """
+    Return the stats collected so far in this process and start over with empty stats
+
+    Returns:
+        Stats, or None when instrumentation is disabled
+    """
+    global _stats
+    if _stats is None:
+        return None
+    stats, _stats = _stats, Stats(_stats.slowest_limit)
+    return stats
+
+
+def timer(name):
+    """
+    Time a block of code: `with timer('match_sentences.pass1'): ...`
+
+    Args:
+        name: str, timer name
+
+    Returns:
+        Context manager (a shared no-op one while disabled)
+    """
+    if _stats is None:
+        return _NULL_TIMER
+    return _Timer(_stats, name)
+
+
+def count(name, amount=1):
+    """
+    Increment a counter (no-op while disabled)
+
+    Args:
+        name: str, counter name
+        amount: int, increment
+    """
+    if _stats is not None:
+        _stats.count(name, amount)
+
+
+def add_report(seconds, report_id='', original_report='', error_report=''):
+    """
+    Record the latency of one report (no-op while disabled), see Stats.add_report
+    """
+    if _stats is not None:
+        _stats.add_report(seconds, report_id, original_report, error_report)
+
+
+def profile_slowest(stats, function, setup=None, top=30):
+    """
+    Run the slowest reports kept in stats again under cProfile and store the profiles in stats
+
+    Args:
+        stats: Stats with slowest reports
+        function: callable(original_report, error_report) to profile
+        setup: callable run (unprofiled) before each report, e.g. to clear caches
+        top: int, number of functions listed per profile (by cumulative time)
+    """
+    for seconds, report_id, original_report, error_report in sorted(stats.slowest, reverse=True):
+        if setup is not None:
+            setup()
+        profiler = cProfile.Profile()
+        profiler.runcall(function, original_report, error_report)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+        stats.profiles.append({'report_id': report_id, 'seconds': seconds, 'profile': output.getvalue()})
@@ -0,0 +1,165 @@
+import hashlib
+import sqlite3
+from collections import OrderedDict
+
+from utils import PATTERN_VERSION
+
+# Bump whenever label_errors changes in a way that changes its results, so stored labels are not reused
+LABEL_MEMO_VERSION = 1
+
+# Upper bound on the number of sentence pairs kept in memory by a LabelMemo
+LABEL_MEMO_SIZE = 100000
+
+
+def pair_key(orig_sentence, err_sentence):
+    """
+    Store key of an exact (original, error) sentence pair
+
+    Returns:
+        bytes, 16 byte BLAKE2b digest
+    """
+    payload = orig_sentence.encode('utf-8') + b'\x00' + err_sentence.encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+class LabelMemo:
+    """
+    Memo of label_errors results per exact (original, error) sentence pair.
+
+    Entries hold the label and error type label_errors assigns without the report-dependent
+    "Add repetition" check, which label_errors applies on top of memoized results. Lookups go to an
+    in-process LRU first and then, when a path is given, to a SQLite store that several worker
+    processes can share. The store records the pattern and memo version it was filled with and is
+    emptied on open when either has changed. Hit and miss counts cover the lifetime of this object.
+    """
+
+    def __init__(self, path=None, max_entries=LABEL_MEMO_SIZE, flush_size=1000):
+        """
+        Args:
+            path: str, SQLite database file shared by workers (None for an in-process memo only)
+            max_entries: int, number of pairs kept in the in-process LRU
+            flush_size: int, number of new entries buffered before they are written to the store
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_size = flush_size
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = []
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._open_store()
+
+    def _open_store(self):
+        version = f'{PATTERN_VERSION}:{LABEL_MEMO_VERSION}'
+        connection = self._connection
+        # one writer at a time, so concurrent workers invalidate an outdated store only once
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS labels (key BLOB PRIMARY KEY, label INTEGER NOT NULL, '
+            'error_type TEXT NOT NULL) WITHOUT ROWID'
+        )
+        row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            connection.execute('DELETE FROM labels')
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+        connection.execute('COMMIT')
+
+    def get(self, orig_sentence, err_sentence):
+        """
+        Look up the memoized result of a sentence pair
+
+        Args:
+            orig_sentence: str, original sentence
+            err_sentence: str, error sentence
+
+        Returns:
+            Tuple (label, error type), or None on a miss
+        """
+        pair = (orig_sentence, err_sentence)
+        result = self._entries.get(pair)
+        if result is not None:
+            self._entries.move_to_end(pair)
+            self.hits += 1
+            return result
+        if self._connection is not None:
+            row = self._connection.execute(
+                'SELECT label, error_type FROM labels WHERE key = ?', (pair_key(orig_sentence, err_sentence),)
+            ).fetchone()
+            if row is not None:
+                self.store_hits += 1
+                self._remember(pair, row)
+                return row
+        self.misses += 1
+        return None
+
+    def put(self, orig_sentence, err_sentence, label, error_type):
+        """
+        Memoize the result of a sentence pair
+
+        Args:
+            orig_sentence: str, original sentence
+            err_sentence: str, error sentence
+            label: int, label assigned by label_errors
+            error_type: str, error type assigned by label_errors, without the repetition check
+        """
+        self._remember((orig_sentence, err_sentence), (label, error_type))
+        if self._connection is not None:
+            self._pending.append((pair_key(orig_sentence, err_sentence), label, error_type))
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def _remember(self, pair, result):
+        self._entries[pair] = result
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """
+        Write buffered entries to the store
+        """
+        if self._connection is None or not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO labels (key, label, error_type) VALUES (?, ?, ?)', self._pending
+            )
+        self._pending = []
+
+    def stats(self):
+        """
+        Memo statistics
+
+        Returns:
+            Dict with hits (in-process), store_hits, misses, hit_rate, entries (in-process) and
+            stored (entries in the store, None without a store)
+        """
+        lookups = self.hits + self.store_hits + self.misses
+        stored = None
+        if self._connection is not None:
+            stored = self._connection.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+        return {
+            'hits': self.hits,
+            'store_hits': self.store_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.store_hits) / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'stored': stored,
+        }
+
+    def close(self):
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
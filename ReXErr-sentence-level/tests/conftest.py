@@ -0,0 +1,32 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+
+@pytest.fixture(scope='session')
+def nltk_models():
+    # sentence features are tokenized and tagged with NLTK; skip where its data is not installed
+    try:
+        utils.warmup()
+    except LookupError as error:
+        pytest.skip(f"NLTK data not available: {error}")
+
+
+@pytest.fixture(scope='session')
+def splicing():
+    return importlib.import_module('ReXErr-sentence-level-splicing')
+
+
+@pytest.fixture(scope='session')
+def labeling():
+    return importlib.import_module('ReXErr-sentence-level-label-regex')
+
+
+@pytest.fixture(scope='session')
+def relabeling():
+    return importlib.import_module('ReXErr-sentence-level-relabel')
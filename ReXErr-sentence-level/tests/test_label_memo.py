@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+import label_memo
+from label_memo import LabelMemo
+from test_labeling import OTHER_REPORT, PAIRS, REPORT
+
+
+def test_memo_lru_and_counts():
+    memo = LabelMemo(max_entries=2)
+    assert memo.get('a', 'b') is None
+    memo.put('a', 'b', 1, "Add typo")
+    memo.put('c', 'd', 0, "Not applicable")
+    assert memo.get('a', 'b') == (1, "Add typo")
+    # ('c', 'd') is now the least recently used pair
+    memo.put('e', 'f', 2, "Change severity")
+    assert memo.get('c', 'd') is None
+    assert memo.stats() == {'hits': 1, 'store_hits': 0, 'misses': 2, 'hit_rate': 1 / 3, 'entries': 2,
+                            'stored': None}
+
+
+@pytest.mark.parametrize('max_entries', [8, 100])
+def test_memo_matches_no_memo(nltk_models, labeling, max_entries):
+    # with 8 entries the pairs keep evicting each other
+    memo = LabelMemo(max_entries=max_entries)
+    original_sentences, error_sentences = zip(*PAIRS)
+    # the same added pairs are repetitions in one report and not in the other
+    for report in [REPORT, OTHER_REPORT, REPORT, OTHER_REPORT]:
+        expected = labeling.label_errors(list(original_sentences), list(error_sentences), report, '')
+        assert labeling.label_errors(list(original_sentences), list(error_sentences), report, '', memo=memo) == expected
+    frame = pd.DataFrame(PAIRS, columns=['original_sentence', 'error_sentence'])
+    frame['original_report'] = REPORT
+    assert labeling.label_errors_frame(frame, memo=memo).equals(labeling.label_errors_frame(frame))
+    assert memo.stats()['entries'] == min(max_entries, len(set(PAIRS)))
+    if max_entries >= len(set(PAIRS)):
+        assert memo.stats()['misses'] == len(set(PAIRS))
+
+
+def test_memo_store_is_shared_and_invalidated(nltk_models, labeling, tmp_path, monkeypatch):
+    path = str(tmp_path / 'labels.db')
+    original_sentences, error_sentences = zip(*PAIRS)
+    expected = labeling.label_errors(list(original_sentences), list(error_sentences), REPORT, '')
+
+    with LabelMemo(path) as memo:
+        labeling.label_errors(list(original_sentences), list(error_sentences), REPORT, '', memo=memo)
+    with LabelMemo(path) as memo:
+        assert labeling.label_errors(list(original_sentences), list(error_sentences), REPORT, '', memo=memo) == expected
+        assert memo.stats()['store_hits'] == len(set(PAIRS))
+
+    monkeypatch.setattr(label_memo, 'PATTERN_VERSION', 'changed')
+    with LabelMemo(path) as memo:
+        assert memo.stats()['stored'] == 0
+
+
+def test_memo_store_is_invalidated_by_the_memo_version(tmp_path, monkeypatch):
+    path = str(tmp_path / 'labels.db')
+    with LabelMemo(path) as memo:
+        memo.put('a', 'b', 1, "Add typo")
+    with LabelMemo(path) as memo:
+        assert memo.get('a', 'b') == (1, "Add typo")
+    monkeypatch.setattr(label_memo, 'LABEL_MEMO_VERSION', label_memo.LABEL_MEMO_VERSION + 1)
+    with LabelMemo(path) as memo:
+        assert memo.get('a', 'b') is None
+        assert memo.stats()['stored'] == 0
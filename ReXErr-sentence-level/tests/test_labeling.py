@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+REPORT = (
+    "Impression: No acute cardiopulmonary process.  Large right pleural effusion is unchanged.  "
+    "Endotracheal tube tip is 4 cm above the carina.\nHeart size is normal."
+)
+OTHER_REPORT = "Findings: Lungs are clear.  No pneumothorax."
+
+# (original sentence, error sentence, label, error type) covering every branch of label_errors; the
+# labels are those of label_errors before sentence features, the lexicon scanner and the banded
+# homophone/typo search were introduced, with REPORT as the original report
+LABELED_PAIRS = [
+    ('', 'Heart size is normal.', 1, "Add repetition"),                   # added, repeats a sentence
+    ('', 'pleural effusion is unchanged.', 2, "Add repetition"),          # added, repeats a substring, prior
+    ('', 'A new nasogastric tube is seen.', 2, "Add medical device"),     # added device, prior
+    ('', 'Mild atelectasis at the bases.', 1, "False prediction"),        # added finding
+    ('', '', 1, "Add repetition"),                                        # empty pair
+    ('Large right pleural effusion is unchanged.', '', 2, "False negation"),  # removed, prior
+    ('Heart size is normal.', '', 1, "False negation"),                   # removed
+    ('Heart size is enlarged.', 'Heart size is normal.', 1, "False negation"),
+    ('Heart size is normal.', 'Heart size is normal.', 0, "Not applicable"),
+    ('Large right pleural effusion is unchanged.', 'Large right pleural effusion is unchanged.', 2, "Not applicable"),
+    ('Small left effusion.', 'Large left effusion.', 1, "Change severity"),
+    ('Small left effusion.', 'Small right effusion.', 1, "Change location"),
+    ('Endotracheal tube in place.', 'Nasogastric tube in place.', 1, "Change name of device"),
+    ('Right IJ catheter ends in the upper SVC.', 'Right IJ catheter ends in the mid SVC.', 1,
+     "Change position of device"),
+    ('Nodule measures 5 mm.', 'Nodule measures 5 cm.', 1, "Change measurement"),
+    ('The lungs are clear.', 'The lungs are claer.', 1, "Add typo"),
+    ('Mild pulmonary edema.', 'Mild pulmonary edema persists.', 2, "Add typo"),  # 'edema.' vs 'edema', prior
+    ('The tube is seen.', 'The tube is scene.', 1, "Add typo"),
+    ('Write lung is clear.', 'Right lung is clear.', 1, "Change to homophone"),
+    ('Mild pulmonary edema.', 'Moderate pulmonary edema.', 1, "Change severity"),
+]
+
+PAIRS = [(orig_sentence, err_sentence) for orig_sentence, err_sentence, _, _ in LABELED_PAIRS]
+
+
+def _row_labels(labeling, pairs, report):
+    labels, error_types = [], []
+    for orig_sentence, err_sentence in pairs:
+        label, error_type = labeling.label_errors([orig_sentence], [err_sentence], report, '')
+        labels += label
+        error_types += error_type
+    return labels, error_types
+
+
+@pytest.mark.parametrize('orig_sentence, err_sentence, label, error_type', LABELED_PAIRS)
+def test_label_errors_known_labels(nltk_models, labeling, orig_sentence, err_sentence, label, error_type):
+    assert labeling.label_errors([orig_sentence], [err_sentence], REPORT, '') == ([label], [error_type])
+
+
+def test_repetition_depends_on_the_report(nltk_models, labeling):
+    labels = labeling.label_errors(['', ''], ['Heart size is normal.', 'pleural effusion is unchanged.'],
+                                   OTHER_REPORT, '')
+    assert labels == ([1, 2], ["False prediction", "False prediction"])
+
+
+def test_batch_matches_rows(nltk_models, labeling):
+    original_sentences, error_sentences = zip(*PAIRS)
+    batch = labeling.label_errors(list(original_sentences), list(error_sentences), REPORT, '')
+    assert batch == _row_labels(labeling, PAIRS, REPORT)
+
+
+@pytest.mark.parametrize('report', [REPORT, OTHER_REPORT])
+def test_frame_matches_label_errors(nltk_models, labeling, report):
+    frame = pd.DataFrame(PAIRS, columns=['original_sentence', 'error_sentence'])
+    frame['original_report'] = report
+    labeled = labeling.label_errors_frame(frame)
+    assert (labeled['error_present'].tolist(), labeled['error_type'].tolist()) == _row_labels(labeling, PAIRS, report)
+
+
+def test_frame_missing_values_and_report_column(nltk_models, labeling):
+    frame = pd.DataFrame(PAIRS, columns=['original_sentence', 'error_sentence'])
+    frame.loc[frame['original_sentence'] == '', 'original_sentence'] = None
+    labeled = labeling.label_errors_frame(frame)
+    assert (labeled['error_present'].tolist(), labeled['error_type'].tolist()) == _row_labels(labeling, PAIRS, '')
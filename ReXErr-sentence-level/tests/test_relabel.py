@@ -0,0 +1,113 @@
+import re
+
+import pytest
+
+import utils
+from utils import PATTERN_FAMILIES, LexiconScanner, clear_caches
+
+REPORT = "Heart size is normal.  Small left effusion.  The lungs are clear."
+
+PAIRS = [
+    ('', 'Heart size is normal.'),                                     # repetition, 'heart' becomes a prior word
+    ('', 'Small effusion.'),                                           # 'effusion' becomes a device
+    ('', 'Mild atelectasis.'),
+    ('Heart size is normal.', ''),
+    ('Small left effusion.', ''),
+    ('Small left effusion.', 'Large left effusion.'),
+    ('Small nodule.', 'Large nodule.'),                                # 'small' is no longer a severity
+    ('Mild edema.', 'Moderate edema.'),
+    ('Left lung is clear.', 'Right lung is clear.'),
+    ('The lungs are clear.', 'The lungs are claer.'),
+    ('Endotracheal tube in place.', 'Nasogastric tube in place.'),
+    ('Nodule measures 5 mm.', 'Nodule measures 5 cm.'),
+    ('Heart size is enlarged.', 'Heart size is normal.'),
+    ('Heart size is normal.', 'Heart size is normal.'),
+]
+
+
+def _changed_families():
+    devices, devices_case = PATTERN_FAMILIES['devices']
+    severity, severity_case = PATTERN_FAMILIES['severity']
+    prior, prior_case = PATTERN_FAMILIES['prior']
+    families = dict(PATTERN_FAMILIES)
+    families['devices'] = (devices + r'|\beffusion\b', devices_case)
+    families['severity'] = (severity.replace('|small', ''), severity_case)
+    families['prior'] = (prior + '|heart', prior_case)
+    return families
+
+
+@pytest.fixture
+def labeled_rows(nltk_models, labeling):
+    labels, error_types = labeling.label_errors(*map(list, zip(*PAIRS)), REPORT, '')
+    rows = []
+    for (orig_sentence, err_sentence), label, error_type in zip(PAIRS, labels, error_types):
+        rows.append({
+            'dicom_id': 'd', 'study_id': 's', 'subject_id': 'p',
+            'original_sentence': orig_sentence, 'error_sentence': err_sentence,
+            'error_present': label, 'error_type': error_type, 'pattern_version': utils.PATTERN_VERSION,
+            'hit_digest': labeling.pair_hit_digest(orig_sentence, err_sentence, error_type),
+        })
+    return rows
+
+
+@pytest.fixture
+def changed_patterns(monkeypatch, labeling, relabeling):
+    families = _changed_families()
+    monkeypatch.setattr(utils, 'lexicon_scanner', LexiconScanner(families))
+    monkeypatch.setattr(labeling, 'lexicon_scanner', utils.lexicon_scanner)
+    monkeypatch.setattr(relabeling, 'PATTERN_VERSION', 'changed')
+    clear_caches()
+    relabeling._pattern_hits.cache_clear()
+    yield families
+    clear_caches()
+    relabeling._pattern_hits.cache_clear()
+
+
+def _hits_changed(families, sentence, names):
+    return any(
+        re.findall(PATTERN_FAMILIES[name][0], sentence, re.IGNORECASE if PATTERN_FAMILIES[name][1] else 0)
+        != re.findall(families[name][0], sentence, re.IGNORECASE if families[name][1] else 0)
+        for name in names
+    )
+
+
+def test_relabel_matches_fresh_labels(labeled_rows, changed_patterns, labeling, relabeling):
+    # which pairs depend on a changed family, from re.findall rather than the hit digests
+    expected_recomputed = sum(
+        _hits_changed(changed_patterns, row['original_sentence'], labeling.label_dependencies(
+            row['original_sentence'], row['error_sentence'], row['error_type']))
+        or _hits_changed(changed_patterns, row['error_sentence'], labeling.label_dependencies(
+            row['original_sentence'], row['error_sentence'], row['error_type']))
+        for row in labeled_rows
+    )
+    old_labels = [(row['error_present'], row['error_type']) for row in labeled_rows]
+    current_row = dict(labeled_rows[2], pattern_version='changed')
+
+    stats = {'pairs': 0, 'current': 0, 'skipped': 0, 'recomputed': 0, 'changed': 0}
+    rows = list(relabeling.relabel([dict(row) for row in labeled_rows] + [current_row], stats))
+
+    labels, error_types = labeling.label_errors(*map(list, zip(*PAIRS)), REPORT, '')
+    assert [(row['error_present'], row['error_type']) for row in rows[:-1]] == list(zip(labels, error_types))
+    assert all(row['pattern_version'] == 'changed' for row in rows)
+    assert rows[-1] == current_row
+    assert 0 < expected_recomputed < len(PAIRS)
+    assert stats == {
+        'pairs': len(PAIRS) + 1, 'current': 1, 'skipped': len(PAIRS) - expected_recomputed,
+        'recomputed': expected_recomputed,
+        'changed': sum(old != new for old, new in zip(old_labels, zip(labels, error_types))),
+    }
+    assert stats['changed'] > 0
+
+    # relabeled rows carry digests of the new patterns, so a second pass skips all of them
+    for row in rows:
+        row['pattern_version'] = 'older'
+    stats = {'pairs': 0, 'current': 0, 'skipped': 0, 'recomputed': 0, 'changed': 0}
+    list(relabeling.relabel(rows, stats))
+    assert stats['skipped'] == len(PAIRS) + 1
+
+
+def test_relabel_without_digest_recomputes(labeled_rows, changed_patterns, relabeling):
+    rows = [dict(row, hit_digest=None) for row in labeled_rows]
+    stats = {'pairs': 0, 'current': 0, 'skipped': 0, 'recomputed': 0, 'changed': 0}
+    list(relabeling.relabel(rows, stats))
+    assert stats['recomputed'] == len(PAIRS)
@@ -0,0 +1,156 @@
+import re
+
+import pytest
+
+from utils import sentence_features
+
+REPORT = (
+    "Impression: Compared to chest radiographs since ___, most recently ___.  Large right and moderate left "
+    "pleural effusions are unchanged.  Cardiac silhouette is obscured.  No pneumothorax."
+)
+
+REPORT_PAIRS = [
+    (REPORT, REPORT.replace('Large right', 'Small right').replace('No pneumothorax.', 'Small pneumothorax.')),
+    (REPORT, "Heart size is normal.  " + REPORT.replace('Cardiac silhouette is obscured.  ', '')),
+    # reordered sentences, so matches cross
+    (REPORT, "No pneumothorax.  Cardiac silhouette is obscured.  " + REPORT.split('.  ')[0] + '.'),
+    ("Findings: Lungs are clear.  Mild cardiomegaly.", "Findings: Lungs are clear.  Impression: Mild cardiomegaly."),
+    ("Dr. Smith discussed the findings with Dr. Jones. Lung volumes are low.",
+     "1. Small left apical pneumothorax.\n2. Tube tip 4.5 cm above the carina."),
+    (REPORT, ''),
+    ('', REPORT),
+]
+
+
+def _reference_match_sentences(splicing, paragraph1, paragraph2):
+    # the four quadratic matching passes before vectorization, on the same sentence features
+    sentences1 = splicing.split_sentences(paragraph1)
+    sentences2 = splicing.split_sentences(paragraph2)
+    nouns1 = [sentence_features(s).nouns for s in sentences1]
+    nouns2 = [sentence_features(s).nouns for s in sentences2]
+    adj1 = [sentence_features(s).adjectives for s in sentences1]
+    adj2 = [sentence_features(s).adjectives for s in sentences2]
+    match1, match2 = [None] * len(sentences1), [None] * len(sentences2)
+
+    def link(i, j):
+        match1[i] = match2[j] = (sentences1[i], sentences2[j])
+
+    for i in range(len(sentences1)):
+        for j in range(len(sentences2)):
+            if match2[j] is None and (('impression' in nouns1[i] and 'impression' in nouns2[j])
+                                      or ('findings' in nouns1[i] and 'findings' in nouns2[j])):
+                link(i, j)
+                break
+    for i in range(len(sentences1)):
+        if match1[i] is None:
+            for j in range(len(sentences2)):
+                if match2[j] is None and sentences1[i].lower() == sentences2[j].lower():
+                    link(i, j)
+                    break
+    for i in range(len(sentences1)):
+        if match1[i] is None:
+            best, best_overlap = None, 0
+            for j in range(len(sentences2)):
+                if match2[j] is None:
+                    noun_overlap = sum(1 for noun in nouns1[i] if noun in nouns2[j])
+                    adj_overlap = sum(1 for adj in adj1[i] if adj in adj2[j])
+                    if noun_overlap > 0 and adj_overlap > 0 and noun_overlap + adj_overlap > best_overlap:
+                        best, best_overlap = j, noun_overlap + adj_overlap
+            if best is not None:
+                link(i, best)
+    for i in range(len(sentences1)):
+        if match1[i] is None:
+            best, best_overlap = None, 0
+            for j in range(len(sentences2)):
+                if match2[j] is None:
+                    noun_overlap = sum(1 for noun in nouns1[i] if noun in nouns2[j])
+                    if noun_overlap > best_overlap:
+                        best, best_overlap = j, noun_overlap
+            if best is not None:
+                link(i, best)
+    return ([m or (s, '') for m, s in zip(match1, sentences1)],
+            [m or ('', s) for m, s in zip(match2, sentences2)])
+
+
+@pytest.mark.parametrize('paragraph1, paragraph2', REPORT_PAIRS)
+def test_match_sentences_matches_reference(nltk_models, splicing, paragraph1, paragraph2):
+    expected = _reference_match_sentences(splicing, paragraph1, paragraph2)
+    assert splicing.match_sentences(paragraph1, paragraph2) == expected
+
+
+def _reference_combine_matches(matches1to2, matches2to1):
+    # combine_matches before the linear-time alignment (reports without repeated sentences)
+    combined, i = [], 0
+    for match in matches1to2:
+        if match[1] == '':
+            combined.append(match)
+        else:
+            while i < len(matches2to1) and matches2to1[i][1] != match[1]:
+                combined.append(matches2to1[i])
+                i += 1
+            if match not in combined:
+                combined.append(match)
+                i += 1
+    combined.extend(match for match in matches2to1[i:] if match not in combined)
+    return combined
+
+
+@pytest.mark.parametrize('paragraph1, paragraph2', REPORT_PAIRS)
+def test_combine_matches_matches_reference(nltk_models, splicing, paragraph1, paragraph2):
+    matches1to2, matches2to1 = splicing.match_sentences(paragraph1, paragraph2)
+    expected = _reference_combine_matches(matches1to2, matches2to1)
+    assert splicing.combine_matches(matches1to2, matches2to1) == expected
+
+
+@pytest.mark.parametrize('matches1to2, matches2to1', [
+    # crossing matches and unmatched sentences on both sides, without sentence features
+    ([('a', 'B'), ('b', ''), ('c', 'A'), ('d', 'D')], [('c', 'A'), ('a', 'B'), ('', 'C'), ('d', 'D'), ('', 'E')]),
+    ([('a', ''), ('b', '')], [('', 'A')]),
+    ([], [('', 'A'), ('', 'B')]),
+    ([('a', 'A')], [('a', 'A')]),
+])
+def test_combine_matches_matches_reference_on_alignments(splicing, matches1to2, matches2to1):
+    expected = _reference_combine_matches(matches1to2, matches2to1)
+    assert splicing.combine_matches(matches1to2, matches2to1) == expected
+
+
+SPLIT_TEXTS = [
+    REPORT,
+    "Dr. Smith discussed the findings with Dr. Jones at 8:55 a.m. on ___. Lung volumes are low, e.g. due to "
+    "poor inspiration vs. atelectasis, i.e. not pneumonia.",
+    "1. Small left apical pneumothorax.\n2. Tube tip 4.5 cm above the carina.\n\nIs there effusion? Possibly!",
+    "Mediastinal contours are unremarkable!Heart size is normal. ",
+    "Mrs. Doe, Prof. Roe and Ms. Poe (Sr. and Jr.) etc. agree.\tNo change.",
+    "",
+    "   ",
+]
+
+
+def _reference_split_sentences(text):
+    # split_sentences before the single-pass rewrite, for texts without '@'
+    abbreviations = ['Mr.', 'Mrs.', 'Ms.', 'Dr.', 'Prof.', 'Sr.', 'Jr.', 'e.g.', 'i.e.', 'etc.', 'vs.', 'a.m.', 'p.m.']
+    for abbr in abbreviations:
+        text = text.replace(abbr, abbr.replace('.', '@'))
+    sentences = [s.replace('@', '.') for s in re.split(r'(?<!\d\.)(?<=[.!?])\s', text)]
+    return [s.strip() for s in sentences if s.strip()]
+
+
+@pytest.mark.parametrize('text', SPLIT_TEXTS)
+def test_split_sentences_matches_reference(splicing, text):
+    assert splicing.split_sentences(text) == _reference_split_sentences(text)
+
+
+@pytest.mark.parametrize('text', SPLIT_TEXTS)
+def test_sentence_spans_slice_the_sentences(splicing, text):
+    assert [text[start:end] for start, end in splicing.sentence_spans(text)] == splicing.split_sentences(text)
+
+
+def test_split_sentences_keeps_at_signs(splicing):
+    # the old splitter turned every '@' into '.'
+    assert splicing.split_sentences("Email rad@hospital.org please. Dr. Smith agrees.") == [
+        "Email rad@hospital.org please.", "Dr. Smith agrees."
+    ]
+
+
+def test_split_sentences_joins_lists(splicing):
+    assert splicing.split_sentences(["No effusion.", "Dr. Smith agrees."]) == ["No effusion.", "Dr. Smith agrees."]
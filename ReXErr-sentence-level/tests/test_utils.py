@@ -0,0 +1,131 @@
+import difflib
+import random
+import re
+
+import phonetics
+import pytest
+
+import utils
+from utils import PATTERN_FAMILIES, LexiconScanner, find_homophones_and_typos, lexicon_scanner
+
+SENTENCES = [
+    "Large Right and moderate LEFT pleural effusions are unchanged.",
+    "The ET tube terminates 4 cm above the carina; ICD and LVAD leads are stable.",
+    "No new focal consolidation, not clear, normal.",
+    "Stent graft and IVC filter in place, 5 mm nodule, previously 3 MM.",
+    "Ståble pleural effusión is more prominent.",
+    "İnterval increase of the İJ catheter tip.",
+    "",
+]
+
+
+@pytest.mark.parametrize('sentence', SENTENCES)
+def test_lexicon_scanner_matches_findall(sentence):
+    hits = lexicon_scanner.scan(sentence)
+    for name, (pattern, ignore_case) in PATTERN_FAMILIES.items():
+        assert hits[name] == re.findall(pattern, sentence, re.IGNORECASE if ignore_case else 0)
+
+
+def test_lexicon_scanner_regex_matches_scan():
+    for name in PATTERN_FAMILIES:
+        for sentence in SENTENCES:
+            assert lexicon_scanner.regex(name).findall(sentence) == lexicon_scanner.scan(sentence)[name]
+
+
+@pytest.mark.parametrize('pattern, ignore_case', [
+    (r'mid|midline|middle|\bmi\b', True),                    # shared first characters keep their order
+    (r'mid|midline|\btube\b|\btip\b|\bchest tube\b', True),  # leading \b on some alternatives only
+    (r'\bET\b|Tube\w*|\d+ ?cm', True),                        # not a literal alternation, uppercase
+    (r'\bNo\b|\bnot\b|Clear', False),
+])
+def test_lexicon_scanner_custom_families(pattern, ignore_case):
+    sentence = "Midline chest TUBE, tip near the MID lung; the ET tubes are 4 cm apart. No, not clear, Clear."
+    scanner = LexiconScanner({'family': (pattern, ignore_case)})
+    assert scanner.scan(sentence)['family'] == re.findall(pattern, sentence, re.IGNORECASE if ignore_case else 0)
+
+
+# Stand-in for WordNet: VALID_WORDS have synsets, and LEMMAS (a subset, as in WordNet) are lemma names
+VALID_WORDS = frozenset([
+    'seen', 'scene', 'right', 'write', 'rite', 'new', 'knew', 'no', 'tube', 'tip', 'to', 'too', 'two', 'be',
+    'by', 'bee', 'or', 'are', 'air', 'heir', 'there', 'their', 'pleural', 'plural', 'ileum', 'ilium', 'mucus',
+    'mucous', 'effusion', 'lung', 'lungs', 'left', 'is', 'the', 'in', 'an', 'as', 'due', 'site', 'sight', 'cite',
+])
+LEMMAS = frozenset(['seen', 'scene', 'write', 'new', 'tube', 'ileum', 'effusion', 'lung', 'site'])
+
+
+class _StubWordNet:
+    def synsets(self, word):
+        return [word] if word in VALID_WORDS else []
+
+
+@pytest.fixture
+def stub_wordnet(monkeypatch):
+    monkeypatch.setattr(utils, '_wordnet', _StubWordNet)
+    monkeypatch.setattr(utils, '_wordnet_lexicon', LEMMAS)
+    utils._is_valid_word.cache_clear()
+    yield
+    utils._is_valid_word.cache_clear()
+
+
+def _reference_homophones_and_typos(sentence1, sentence2, max_position_diff=2):
+    # find_homophones_and_typos before banding and memoization: every word pair is compared
+    words1 = sentence1.lower().split()
+    words2 = sentence2.lower().split()
+    phonetic_words1 = {idx: (word, phonetics.metaphone(word)) for idx, word in enumerate(words1)}
+    phonetic_words2 = {idx: (word, phonetics.metaphone(word)) for idx, word in enumerate(words2)}
+    homophones, typos = [], []
+    for idx1, (word1, _) in phonetic_words1.items():
+        for idx2, (word2, _) in phonetic_words2.items():
+            if abs(idx1 - idx2) <= max_position_diff and word1 != word2:
+                if 0.7 <= difflib.SequenceMatcher(None, word1, word2).ratio() < 1.0:
+                    typos.append((word1, word2))
+    skip_pairs = [('tube', 'tip'), ('due', 'to'), ('no', 'new'), ('an', 'in'), ('as', 'is'), ('air', 'or'),
+                  ('1', '2'), ('or', 'are'), ('be', 'by')]
+    for idx1, (word1, metaphone1) in phonetic_words1.items():
+        for idx2, (word2, metaphone2) in phonetic_words2.items():
+            if any((word1, word2) in typo or (word2, word1) in typo for typo in typos):
+                continue
+            if metaphone1 == metaphone2 and word1 != word2 and abs(idx1 - idx2) <= max_position_diff:
+                if (word1 == 'knew' and word2 == 'new') or (word1 == 'new' and word2 == 'knew'):
+                    homophones.append((word1, word2))
+                    continue
+                if difflib.SequenceMatcher(None, word1, word2).ratio() < 0.7:
+                    if any((word1, word2) in [pair, pair[::-1]] for pair in skip_pairs):
+                        continue
+                    if not _StubWordNet().synsets(word1) or not _StubWordNet().synsets(word2):
+                        continue
+                    homophones.append((word1, word2))
+    return {"homophones": homophones, "typos": typos}
+
+
+HOMOPHONE_TYPO_PAIRS = [
+    ("The right lung is clear.", "The write lung is clear."),
+    ("Right lung seen", "Rite lung scene"),                            # edits at both sentence edges
+    ("Knew effusion.", "New efusion."),
+    ("The tube tip is in the ileum.", "The tip tube is in the ilium."),
+    ("No new effusion.", "Knew no effusion."),                         # skip pairs and 'knew'/'new'
+    ("Be by the site.", "Bee by the sight cite."),                     # sentences of different lengths
+    ("Pleural effusion is mucus.", "Plural effusion"),
+    ("a", "Pneumomediastinum and subcutaneous emphysema are unchanged."),  # words of very different lengths
+    ("Pneumomediastinum is present.", "Pneumomediastinum is presnt."),
+    ("Their there.", "There their."),
+    ("", "Two lungs."),
+    ("1 2 3", "2 1 3"),
+]
+
+
+@pytest.mark.parametrize('sentence1, sentence2', HOMOPHONE_TYPO_PAIRS)
+@pytest.mark.parametrize('max_position_diff', [0, 2, 5])
+def test_homophones_and_typos_match_reference(stub_wordnet, sentence1, sentence2, max_position_diff):
+    expected = _reference_homophones_and_typos(sentence1, sentence2, max_position_diff)
+    assert find_homophones_and_typos(sentence1, sentence2, max_position_diff) == expected
+
+
+def test_homophones_and_typos_match_reference_random(stub_wordnet):
+    rng = random.Random(0)
+    vocabulary = sorted(VALID_WORDS) + ['efusion', 'plueral', 'lng', 'pneumothorax', 'pneumothroax', 'x',
+                                        'cardiomediastinal', 'silhouette', '4.5', 'cm.']
+    for _ in range(500):
+        sentence1 = ' '.join(rng.choices(vocabulary, k=rng.randint(0, 8)))
+        sentence2 = ' '.join(rng.choices(vocabulary, k=rng.randint(0, 8)))
+        assert find_homophones_and_typos(sentence1, sentence2) == _reference_homophones_and_typos(sentence1, sentence2)
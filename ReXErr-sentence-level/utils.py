@@ -1,9 +1,28 @@
-import pandas as pd
-from nltk.corpus import wordnet
+import re
 import difflib
-import phonetics
-from nltk import pos_tag
-from nltk.tokenize import word_tokenize
+import hashlib
+import importlib
+import json
+from functools import lru_cache
+
+from instrumentation import timer
+
+# pandas, NLTK (tokenizer, tagger, WordNet) and phonetics are imported on first use, so
+# importing utils stays cheap for short-lived jobs; call warmup() to load them up front.
+
+
+@lru_cache(maxsize=None)
+def lazy_import(name):
+    """
+    Import an optional or heavy module on first use
+
+    Args:
+        name: str, module name
+
+    Returns:
+        The module; cached, so repeated calls on hot paths cost a dict lookup
+    """
+    return importlib.import_module(name)
 
 
 # Define patterns for extracting medical concepts
@@ -39,6 +58,242 @@ measurement_pattern = (
     r'mm|cm|meters|inches'
 )
 
+
+def _factor_alternation(pattern, ignore_case, fold_case):
+    """
+    Rewrite a flat alternation of literals so that alternatives are grouped by first character.
+
+    Alternatives sharing a first character keep their relative order, so the leftmost-first
+    semantics of the alternation (and hence findall results) are unchanged. Returns None for
+    patterns that are not plain literal alternations, or that put a leading \\b on only some
+    alternatives.
+    """
+    alternatives = pattern.split('|')
+    for alternative in alternatives:
+        literal = alternative[2:] if alternative.startswith(r'\b') else alternative
+        literal = literal[:-2] if literal.endswith(r'\b') else literal
+        if not re.fullmatch(r'[\w \-]+', literal):
+            return None
+    if fold_case:
+        alternatives = [alternative.lower() for alternative in alternatives]
+
+    # a leading \b is hoisted out of the groups, so it has to be on all alternatives or on none
+    prefix = ''
+    leading_boundaries = sum(alternative.startswith(r'\b') for alternative in alternatives)
+    if leading_boundaries == len(alternatives):
+        prefix = r'\b'
+        alternatives = [alternative[2:] for alternative in alternatives]
+    elif leading_boundaries:
+        return None
+
+    groups = {}
+    for alternative in alternatives:
+        first = alternative[0].lower() if ignore_case else alternative[0]
+        groups.setdefault(first, []).append(alternative[1:])
+    return prefix + '(?:' + '|'.join(
+        re.escape(first) + '(?:' + '|'.join(rest) + ')' for first, rest in groups.items()
+    ) + ')'
+
+
+class LexiconScanner:
+    """
+    Precompiled scanner returning the hits of every pattern family for a sentence in one call.
+
+    Results are identical to re.findall(pattern, sentence, flags) for each family. Alternations
+    are factored by first character, and case-insensitive families are matched against a single
+    lowercased copy of ASCII sentences, which avoids the slow per-character case folding of
+    re.IGNORECASE; hits are sliced from the original sentence so their casing is preserved.
+    """
+
+    def __init__(self, families):
+        """
+        Args:
+            families: dict of family name -> (pattern, ignore_case)
+        """
+        self.names = tuple(families)
+        self._exact = {}
+        self._folded = {}
+        for name, (pattern, ignore_case) in families.items():
+            flags = re.IGNORECASE if ignore_case else 0
+            factored = _factor_alternation(pattern, ignore_case, fold_case=False)
+            self._exact[name] = re.compile(factored or pattern, flags)
+            # the lowercased-sentence shortcut needs a pattern that was lowercased along with it
+            if ignore_case and factored is not None and pattern.isascii():
+                self._folded[name] = re.compile(_factor_alternation(pattern, ignore_case, fold_case=True))
+
+    def scan(self, sentence):
+        """
+        Find the hits of every pattern family in a sentence
+
+        Args:
+            sentence: str, input sentence
+
+        Returns:
+            Dict of family name -> list of matched strings, as re.findall would return them
+        """
+        lowered = sentence.lower() if sentence.isascii() else None
+        hits = {}
+        for name in self.names:
+            folded = self._folded.get(name)
+            if folded is not None and lowered is not None:
+                hits[name] = [sentence[match.start():match.end()] for match in folded.finditer(lowered)]
+            else:
+                hits[name] = self._exact[name].findall(sentence)
+        return hits
+
+    def regex(self, name):
+        """
+        Compiled pattern of one family, with its flags, for re-based APIs such as pandas .str methods
+
+        Args:
+            name: str, family name
+
+        Returns:
+            re.Pattern whose findall results equal the hits of scan for that family
+        """
+        return self._exact[name]
+
+
+PATTERN_FAMILIES = {
+    'devices': (devices_pattern, True),
+    'false_negation': (false_negation, False),
+    'location': (location_pattern, True),
+    'severity': (severity_pattern, True),
+    'prior': (prior_pattern, True),
+    'measurement': (measurement_pattern, True),
+}
+
+lexicon_scanner = LexiconScanner(PATTERN_FAMILIES)
+
+
+def pattern_fingerprints(families=PATTERN_FAMILIES):
+    """
+    Fingerprint every pattern family, so labels can record which pattern definitions produced them
+
+    Args:
+        families: dict of family name -> (pattern, ignore_case)
+
+    Returns:
+        Dict of family name -> 16 hex digit fingerprint of the pattern and its flags
+    """
+    return {
+        name: hashlib.sha256(f'{int(ignore_case)}:{pattern}'.encode('utf-8')).hexdigest()[:16]
+        for name, (pattern, ignore_case) in families.items()
+    }
+
+
+# Version of the pattern set as a whole; changes whenever any pattern in this file changes
+PATTERN_VERSION = hashlib.sha256(
+    json.dumps(pattern_fingerprints(), sort_keys=True).encode('utf-8')
+).hexdigest()[:16]
+
+# Upper bound on the number of distinct sentences kept by sentence_features
+SENTENCE_FEATURES_CACHE_SIZE = 100000
+
+# Upper bound on the number of distinct words/word pairs kept by the word-level caches
+WORD_CACHE_SIZE = 200000
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _metaphone(word):
+    return lazy_import('phonetics').metaphone(word)
+
+
+class SentenceFeatures:
+    """
+    Features of a single sentence shared by sentence matching and error labeling.
+
+    Built with one tokenize/POS-tag pass; all fields are immutable so instances
+    can be shared through the sentence_features cache.
+    """
+    __slots__ = (
+        'lower', 'nouns', 'adjectives', 'words', 'metaphones',
+        'has_prior', 'has_negation', 'devices', 'locations', 'severities', 'measurements',
+    )
+
+    def __init__(self, sentence):
+        nltk = lazy_import('nltk')
+        with timer('pos_tagging'):
+            tagged = nltk.pos_tag(nltk.word_tokenize(sentence)) if sentence else []
+        self.lower = sentence.lower()
+        self.nouns = tuple(word.lower() for word, pos in tagged if pos.startswith('N'))
+        self.adjectives = tuple(word.lower() for word, pos in tagged if pos.startswith('J'))
+        self.words = tuple(self.lower.split())
+        self.metaphones = tuple(_metaphone(word) for word in self.words)
+        (self.has_prior, self.has_negation, self.devices, self.locations, self.severities,
+         self.measurements) = _pattern_fields(sentence)
+
+
+def _pattern_fields(sentence):
+    hits = lexicon_scanner.scan(sentence)
+    return (
+        bool(hits['prior']),
+        bool(hits['false_negation']),
+        tuple(hits['devices']),
+        tuple(hits['location']),
+        tuple(hits['severity']),
+        tuple(hits['measurement']),
+    )
+
+
+class PatternHits:
+    """
+    The pattern-derived fields of SentenceFeatures, computed without tokenizing or tagging.
+
+    Used to check cheaply whether changed patterns affect a labeled sentence.
+    """
+    __slots__ = ('has_prior', 'has_negation', 'devices', 'locations', 'severities', 'measurements')
+
+    def __init__(self, sentence):
+        (self.has_prior, self.has_negation, self.devices, self.locations, self.severities,
+         self.measurements) = _pattern_fields(sentence)
+
+
+@lru_cache(maxsize=SENTENCE_FEATURES_CACHE_SIZE)
+def sentence_features(sentence):
+    """
+    Get the (cached) features of a sentence
+
+    Args:
+        sentence: str, input sentence
+
+    Returns:
+        SentenceFeatures for the sentence
+    """
+    return SentenceFeatures(sentence)
+
+
+def _isna(value):
+    # strings are never missing; anything else goes through pandas like before
+    if isinstance(value, str):
+        return False
+    return lazy_import('pandas').isna(value)
+
+
+def warmup(wordnet_lexicon=True):
+    """
+    Load the lazily imported models up front, e.g. from a process pool initializer
+
+    Args:
+        wordnet_lexicon: bool, also load WordNet and build the lemma lexicon used for homophones
+    """
+    lazy_import('pandas')
+    SentenceFeatures('Warm up the tokenizer and tagger.')
+    if wordnet_lexicon:
+        _wordnet().ensure_loaded()
+        _get_wordnet_lexicon()
+
+
+def clear_caches():
+    """
+    Empty the sentence and word caches, e.g. to time or profile a cold run
+    """
+    sentence_features.cache_clear()
+    _metaphone.cache_clear()
+    _is_similar.cache_clear()
+    _is_valid_word.cache_clear()
+
+
 def get_nouns(sentence):
     """
     Extract nouns from a sentence
@@ -49,10 +304,7 @@ def get_nouns(sentence):
     Returns:
         List of nouns in the sentence
     """
-    words = word_tokenize(sentence)
-    tagged = pos_tag(words)
-    nouns = [word.lower() for word, pos in tagged if pos.startswith('N')]
-    return nouns
+    return list(sentence_features(sentence).nouns)
 
 def get_adj(sentence):
     """
@@ -64,20 +316,14 @@ def get_adj(sentence):
     Returns:
         List of adjectives in the sentence
     """
-    words = word_tokenize(sentence)
-    tagged = pos_tag(words)
-    adj = [word.lower() for word, pos in tagged if pos.startswith('J')]
-    return adj
+    return list(sentence_features(sentence).adjectives)
 
 
 def find_homophones_and_typos(sentence1, sentence2, max_position_diff=2):
     """
     Detect homophones and typos between two sentences
     """
-    def is_valid_word(word):
-        return bool(wordnet.synsets(word))
-    
-    if pd.isna(sentence1) or pd.isna(sentence2):
+    if _isna(sentence1) or _isna(sentence2):
         return {"homophones": [], "typos": []}
         
     # Tokenize sentences into words
@@ -85,53 +331,108 @@ def find_homophones_and_typos(sentence1, sentence2, max_position_diff=2):
     words2 = sentence2.lower().split()
 
     # Generate phonetic representations using Metaphone
-    phonetic_words1 = {idx: (word, phonetics.metaphone(word)) for idx, word in enumerate(words1)}
-    phonetic_words2 = {idx: (word, phonetics.metaphone(word)) for idx, word in enumerate(words2)}
+    metaphones1 = [_metaphone(word) for word in words1]
+    metaphones2 = [_metaphone(word) for word in words2]
 
+    return _homophones_and_typos(words1, metaphones1, words2, metaphones2, max_position_diff)
+
+
+def find_feature_homophones_and_typos(features1, features2, max_position_diff=2):
+    """
+    Detect homophones and typos between two sentences from their precomputed features
+
+    Args:
+        features1: SentenceFeatures, features of the first sentence
+        features2: SentenceFeatures, features of the second sentence
+        max_position_diff: int, maximum word position difference between compared words
+
+    Returns:
+        Dict with the "homophones" and "typos" word pairs, as in find_homophones_and_typos
+    """
+    return _homophones_and_typos(features1.words, features1.metaphones,
+                                 features2.words, features2.metaphones, max_position_diff)
+
+
+# Word pairs that share a metaphone but are not treated as homophones
+_NON_HOMOPHONE_PAIRS = frozenset(
+    pair
+    for word1, word2 in [
+        ('tube', 'tip'), ('due', 'to'), ('no', 'new'),
+        ('an', 'in'), ('as', 'is'), ('air', 'or'),
+        ('1', '2'), ('or', 'are'), ('be', 'by')
+    ]
+    for pair in ((word1, word2), (word2, word1))
+)
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _is_similar(word1, word2):
+    """
+    Whether difflib.SequenceMatcher(None, word1, word2).ratio() >= 0.7
+    """
+    # ratio = 2 * matches / (len1 + len2) and matches <= min(len1, len2), so the
+    # length bound rejects most pairs without running the matcher
+    length_bound = 2.0 * min(len(word1), len(word2)) / (len(word1) + len(word2))
+    if length_bound < 0.7:
+        return False
+    return difflib.SequenceMatcher(None, word1, word2).ratio() >= 0.7
+
+
+def _wordnet():
+    return lazy_import('nltk.corpus').wordnet
+
+
+_wordnet_lexicon = None
+
+
+def _get_wordnet_lexicon():
+    global _wordnet_lexicon
+    if _wordnet_lexicon is None:
+        _wordnet_lexicon = frozenset(_wordnet().all_lemma_names())
+    return _wordnet_lexicon
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _is_valid_word(word):
+    # Lemma names are always valid; inflected forms still need WordNet's morphy lookup
+    return word in _get_wordnet_lexicon() or bool(_wordnet().synsets(word))
+
+
+def _homophones_and_typos(words1, metaphones1, words2, metaphones2, max_position_diff):
     homophones = []
     typos = []
 
+    # Only word pairs within max_position_diff of each other are compared
+    def band(idx1):
+        return range(max(0, idx1 - max_position_diff), min(len(words2), idx1 + max_position_diff + 1))
+
     # First pass: check all nearby words for typos
-    for idx1, (word1, _) in phonetic_words1.items():
-        for idx2, (word2, _) in phonetic_words2.items():
-            if abs(idx1 - idx2) <= max_position_diff and word1 != word2:
-                similarity_ratio = difflib.SequenceMatcher(None, word1, word2).ratio()
-                
-                # High similarity (but not identical) suggests a typo
-                if 0.7 <= similarity_ratio < 1.0:
-                    typos.append((word1, word2))
-
-    # Second pass: check for homophones among non-typo words
-    for idx1, (word1, metaphone1) in phonetic_words1.items():
-        for idx2, (word2, metaphone2) in phonetic_words2.items():
-            # Skip if already identified as a typo
-            if any((word1, word2) in typo or (word2, word1) in typo for typo in typos):
+    for idx1, word1 in enumerate(words1):
+        for idx2 in band(idx1):
+            word2 = words2[idx2]
+            # High similarity (but not identical) suggests a typo
+            if word1 != word2 and _is_similar(word1, word2):
+                typos.append((word1, word2))
+
+    # Second pass: check for homophones among non-typo words (typos fail the similarity check)
+    for idx1, (word1, metaphone1) in enumerate(zip(words1, metaphones1)):
+        for idx2 in band(idx1):
+            word2 = words2[idx2]
+            if metaphone1 != metaphones2[idx2] or word1 == word2:
                 continue
-                
-            # Check for homophones
-            if metaphone1 == metaphone2 and word1 != word2 and abs(idx1 - idx2) <= max_position_diff:
-                # Known homophones
-                if (word1 == 'knew' and word2 == 'new') or (word1 == 'new' and word2 == 'knew'):
-                    homophones.append((word1, word2))
-                    continue
-                
-                # Check similarity
-                similarity_ratio = difflib.SequenceMatcher(None, word1, word2).ratio()
-                
-                if similarity_ratio < 0.7:  # Lower similarity suggests a homophone
-                    # Skip specific non-homophone cases
-                    skip_pairs = [
-                        ('tube', 'tip'), ('due', 'to'), ('no', 'new'),
-                        ('an', 'in'), ('as', 'is'), ('air', 'or'),
-                        ('1', '2'), ('or', 'are'), ('be', 'by')
-                    ]
-                    
-                    if any((word1, word2) in [pair, pair[::-1]] for pair in skip_pairs):
-                        continue
-                        
-                    if not is_valid_word(word1) or not is_valid_word(word2):
-                        continue
-                    
-                    homophones.append((word1, word2))
-    
+
+            # Known homophones
+            if (word1 == 'knew' and word2 == 'new') or (word1 == 'new' and word2 == 'knew'):
+                homophones.append((word1, word2))
+                continue
+
+            # Lower similarity suggests a homophone; skip specific non-homophone cases
+            if _is_similar(word1, word2) or (word1, word2) in _NON_HOMOPHONE_PAIRS:
+                continue
+
+            if not _is_valid_word(word1) or not _is_valid_word(word2):
+                continue
+
+            homophones.append((word1, word2))
+
     return {"homophones": homophones, "typos": typos}